@@ -1,44 +1,28 @@
 # Please install following python librarires before executing the file
 # ytdlp, moviepy, pydub and ffmpeg (application)
+# The pipeline itself lives in program_2/mashup_pipeline, shared with the web apps
 
 # exectute the python file using command line (terminal) using the following format:-
-# python 102203804.py "<singer_name>" <Number_of_videos> <Audio_Duration> <Output_FileName.mp3>
+# python 102203804.py "<singer_name>" <Number_of_videos> <Audio_Duration> <Output_FileName.mp3> [--render pydub|ffmpeg] [--format mp3|mp3-vbr|opus|aac|flac] [--bitrate 128k]
 # eg-> python 102203804.py "sharry maan" 12 35 final_mashup.mp3
+# eg-> python 102203804.py "sharry maan" 12 35 final_mashup.mp3 --render ffmpeg
+# eg-> python 102203804.py "sharry maan" 12 35 final_mashup.opus --bitrate 64k
 
 import os
 import sys
-import yt_dlp
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from moviepy.editor import VideoFileClip
-from pydub import AudioSegment
+import argparse
+import subprocess
 
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "program_2"))
 
-# Function to search YouTube Music links
-def search_youtube_music_links(query, max_results):
-    ydl_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'force_generic_extractor': True,
-    }
+from mashup_pipeline import (PipelineConfig, OUTPUT_FORMATS, available_backends, format_for_filename,
+                             filename_for_format, search_links, download_videos, render)
 
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        search_url = f"ytsearch{max_results}:{query}"
-        result = ydl.extract_info(search_url, download=False)
-
-    links = []
-    for entry in result['entries']:
-        try:
-            link = f"https://www.youtube.com/watch?v={entry['id']}"
-            links.append(link)
-        except yt_dlp.utils.DownloadError as e:
-            print(f"Skipping {entry['title']}: {e}")
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-    return links
 
 # Function to write links to a text file in a specified folder
 def write_links_to_file(links, folder_path, file_name):
@@ -57,69 +41,11 @@ def write_links_to_file(links, folder_path, file_name):
     if os.stat(file_path).st_size == 0:
         raise ValueError("No links were generated, file is empty!")
 
-def download_single_video(url, index, download_path):
-    ydl_opts = {
-        'format': 'bestvideo[height<=480]+bestaudio/best',
-        'outtmpl': f'{download_path}/video_{index}.%(ext)s',
-        'quiet': True,
-        'no_warnings': True,
-    }
-
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-        downloaded_files = [f for f in os.listdir(download_path) if f.startswith(f"video_{index}.")]
-        if downloaded_files:
-            return os.path.join(download_path, downloaded_files[0])
-        else:
-            logging.error(f"Downloaded video file not found for {url}")
-            return None
-    except Exception as e:
-        logging.error(f"Error downloading video: {e}")
-        return None
-
-def download_all_videos(video_urls, download_path):
-    downloaded_files = []
-    with ThreadPoolExecutor() as executor:
-        futures = {
-            executor.submit(download_single_video, url, index, download_path): index
-            for index, url in enumerate(video_urls, start=1)
-        }
-
-        for future in as_completed(futures):
-            try:
-                video_file = future.result()
-                if video_file:
-                    downloaded_files.append(video_file)
-            except Exception as e:
-                logging.error(f"Error occurred: {e}")
-
-    return downloaded_files
-
-def convert_all_videos_to_audio(video_files, audio_folder):
-    # Clear previous audio files
-    if os.path.exists(audio_folder):
-        for f in os.listdir(audio_folder):
-            os.remove(os.path.join(audio_folder, f))
-    else:
-        os.makedirs(audio_folder)
-
-    for index, video_file in enumerate(video_files, start=1):
-        try:
-            video = VideoFileClip(video_file)
-            audio_file = os.path.join(audio_folder, f'song_{index}.mp3')
-            video.audio.write_audiofile(audio_file, codec='mp3', bitrate='192k', ffmpeg_params=["-loglevel", "quiet"])
-            video.close()
-            logging.info(f"Converted {video_file} to {audio_file}")
-        except Exception as e:
-            logging.error(f"Error converting {video_file} to audio: {e}")
-
-
-def download_audio_from_links(links_folder, file_name):
+def download_videos_from_links(links_folder, file_name, number_of_videos, config):
     file_path = os.path.join(links_folder, file_name)
     if not os.path.exists(file_path):
         logging.error("Links file does not exist.")
-        return
+        return []
 
     with open(file_path, 'r') as file:
         links = file.readlines()
@@ -129,46 +55,31 @@ def download_audio_from_links(links_folder, file_name):
 
     for f in os.listdir(video_folder):
         os.remove(os.path.join(video_folder, f))
-    
-    downloaded_videos = download_all_videos([link.strip() for link in links if link.strip()], video_folder)
+
+    downloaded_videos = download_videos([link.strip() for link in links if link.strip()], video_folder,
+                                        number_of_videos, config)
 
     if downloaded_videos:
         logging.info(f"Downloaded {len(downloaded_videos)} video files to {video_folder}.")
-        
-        audio_folder = os.path.join(os.getcwd(), "3.audios")
-        convert_all_videos_to_audio(downloaded_videos, audio_folder)
-
     else:
         logging.error("No video files were downloaded.")
 
-def create_mashup(input_dir, output_file, duration):
-    mashup = AudioSegment.silent(duration=0)
-    
-    for filename in os.listdir(input_dir):
-        if filename.endswith('.mp3') or filename.endswith('.wav') or filename.endswith('.ogg'):
-            audio_path = os.path.join(input_dir, filename)
-            audio = AudioSegment.from_file(audio_path)
-            
-            if len(audio) > duration * 1000:  # Convert seconds to milliseconds
-                audio = audio[:duration * 1000]
-            else:
-                audio += AudioSegment.silent(duration=(duration * 1000) - len(audio))
-            
-            mashup += audio
-            logging.info(f'Added {filename} to the mashup')
-    
-    mashup_path = os.path.join(os.getcwd(), "4.mashup", output_file)
-    if os.path.exists(mashup_path):
-        os.remove(mashup_path)  # Delete the existing mashup file if it exists
-    mashup.export(mashup_path, format='mp3')
-    logging.info(f'Mashup saved as {mashup_path}')
+    return downloaded_videos
 
 # Main function
 def main():
     if len(sys.argv) < 5:
-        print("Input Error; Format:-\nUsage: python codename.py <singer_name> <number_of_videos> <duration_in_seconds> <final_mashup_filename>")
+        print("Input Error; Format:-\nUsage: python codename.py <singer_name> <number_of_videos> <duration_in_seconds> <final_mashup_filename> [--render pydub|ffmpeg] [--format mp3|mp3-vbr|opus|aac|flac] [--bitrate 128k]")
         return
 
+    options_parser = argparse.ArgumentParser(prog="102203804.py", description="Optional mashup settings")
+    options_parser.add_argument('--render', choices=available_backends('render'), default='pydub',
+                                help="pydub converts each clip first, ffmpeg renders the downloads in one pass")
+    options_parser.add_argument('--format', choices=OUTPUT_FORMATS, default=None,
+                                help="Output encoding (default: from the file extension, else mp3)")
+    options_parser.add_argument('--bitrate', default=None, help="Output bitrate such as 96k (default: per format)")
+    options = options_parser.parse_args(sys.argv[5:])
+
     singer_name = sys.argv[1]
     try:
         number_of_videos = int(sys.argv[2])
@@ -186,10 +97,27 @@ def main():
         print("Error: The number of results cannot exceed 50.")
         return
 
+    try:
+        # MASHUP_MEMORY_BUDGET_MB enables memory-bounded mode here too
+        config = PipelineConfig.from_env(
+            render_backend=options.render,
+            output_format=options.format or format_for_filename(final_mashup_filename),
+            bitrate=options.bitrate,
+        ).validate()
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
+    # --format wins over the file name, so make the extension match the data written
+    output_filename = filename_for_format(final_mashup_filename, config.output_format)
+    if output_filename != final_mashup_filename:
+        print(f"Saving as {output_filename} to match the {config.output_format} format")
+        final_mashup_filename = output_filename
+
     folder_path = os.path.join(os.getcwd(), "1.links")
     file_name = "links.txt"
 
-    links = search_youtube_music_links(f"{singer_name} official new video song", number_of_videos)
+    links = search_links(singer_name, number_of_videos, config)
 
     if not links:
         print("Error: No links found for the query.")
@@ -199,15 +127,20 @@ def main():
         write_links_to_file(links, folder_path, file_name)
         print(f"Links saved to {os.path.join(folder_path, file_name)}")
 
-        download_audio_from_links(folder_path, file_name)
+        downloaded_videos = download_videos_from_links(folder_path, file_name, number_of_videos, config)
+        if not downloaded_videos:
+            return
 
         audio_folder = os.path.join(os.getcwd(), "3.audios")
         mashup_folder = os.path.join(os.getcwd(), "4.mashup")
         os.makedirs(mashup_folder, exist_ok=True)
 
-        create_mashup(audio_folder, final_mashup_filename, duration)
+        mashup_path = os.path.join(mashup_folder, final_mashup_filename)
+        if os.path.exists(mashup_path):
+            os.remove(mashup_path)  # Delete the existing mashup file if it exists
+        render(downloaded_videos, audio_folder, mashup_path, duration, config)
 
-    except ValueError as e:
+    except (ValueError, RuntimeError, subprocess.CalledProcessError) as e:
         print(e)
 
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+# Benchmark the render stage in isolation: every registered render backend on a
+# folder of already downloaded videos.
+# Usage: python benchmark_render.py <video_folder> <duration_in_seconds>
+#
+# Reports wall time, CPU time (this process plus the ffmpeg children it waits on),
+# output size and SNR against a lossless reference built from the same clips.
+# The reference is assembled here in numpy (decode, trim, pad, join) so it shares
+# no code with any backend and doesn't favour one of them.
+
+import os
+import sys
+import time
+import shutil
+import resource
+import tempfile
+import subprocess
+import logging
+
+import numpy as np
+
+from mashup_pipeline import PipelineConfig, available_backends, get_backend
+from mashup_pipeline.ffmpeg_render import has_audio_stream
+
+VIDEO_EXTENSIONS = ('.mp4', '.webm', '.mkv', '.m4a', '.mp3')
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def measure(render):
+    cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+    render()
+    return cpu_seconds() - cpu_start, time.perf_counter() - wall_start
+
+
+def decode_samples(path):
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', path, '-map', '0:a:0',
+               '-f', 's16le', '-ac', '2', '-ar', '44100', '-']
+    raw = subprocess.run(command, capture_output=True, check=True).stdout
+    return np.frombuffer(raw, dtype=np.int16).astype(np.float64)
+
+
+def build_reference(video_files, duration):
+    # Plain decode of every clip, then trim/pad to `duration` and join, all in numpy
+    clip_samples = duration * 44100 * 2
+    clips = []
+    for video_file in video_files:
+        samples = decode_samples(video_file)[:clip_samples]
+        clips.append(np.pad(samples, (0, clip_samples - len(samples))))
+    return np.concatenate(clips)
+
+
+def snr_db(reference, candidate):
+    length = min(len(reference), len(candidate))
+    reference, candidate = reference[:length], candidate[:length]
+    noise = np.sum((reference - candidate) ** 2)
+    if noise == 0:
+        return float('inf')
+    return 10 * np.log10(np.sum(reference ** 2) / noise)
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python benchmark_render.py <video_folder> <duration_in_seconds>")
+        return
+
+    video_folder = sys.argv[1]
+    duration = int(sys.argv[2])
+    video_files = sorted(
+        os.path.join(video_folder, f) for f in os.listdir(video_folder)
+        if f.lower().endswith(VIDEO_EXTENSIONS)
+    )
+    video_files = [f for f in video_files if has_audio_stream(f)]
+    if not video_files:
+        print(f"No videos with audio found in {video_folder}")
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="mashup_bench_")
+    try:
+        config = PipelineConfig()
+        reference_samples = build_reference(video_files, duration)
+
+        print(f"{len(video_files)} clips x {duration}s")
+        print(f"{'backend':<8} {'cpu (s)':>9} {'wall (s)':>9} {'size (KB)':>10} {'SNR (dB)':>9}")
+        for backend in available_backends('render'):
+            output = os.path.join(work_dir, f"{backend}_mashup.mp3")
+            render = get_backend('render', backend)
+            cpu, wall = measure(lambda: render(video_files, os.path.join(work_dir, f"{backend}_audios"),
+                                               output, duration, config.replace(render_backend=backend)))
+            size_kb = os.path.getsize(output) / 1024
+            snr = snr_db(reference_samples, decode_samples(output))
+            print(f"{backend:<8} {cpu:>9.2f} {wall:>9.2f} {size_kb:>10.0f} {snr:>9.2f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+    main()
@@ -0,0 +1,23 @@
+# Shared mashup pipeline used by the CLI (program_1), app.py and localhost_app.py.
+#
+# Stages, each usable and benchmarkable on its own:
+#   search   -> search.py   (registry backends: ytdlp, youtube_api)
+#   download -> download.py
+#   convert  -> convert.py  (lossless WAV intermediates)
+#   render   -> render.py   (registry backends: pydub, ffmpeg; streaming under a memory budget)
+#   deliver  -> delivery.py (zip + email)
+# PipelineConfig carries the per-job choices and run_pipeline chains the stages.
+
+from .registry import register, get_backend, available_backends
+from .config import PipelineConfig, DEFAULT_SEARCH_BACKEND, DEFAULT_RENDER_BACKEND
+from .formats import (OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT, output_extension, format_for_filename,
+                      filename_for_format, validate_output)
+from .memory import MemoryBudget
+from .search import search_youtube_music_links, search_youtube_api_links
+from .download import download_single_video, download_all_videos
+from .convert import convert_all_videos_to_audio
+from .ffmpeg_render import create_mashup_ffmpeg
+from .render import create_mashup, render
+from .delivery import create_zip, send_email, send_email_file, deliver_mashup, zip_name_for
+from .pipeline import (run_pipeline, run_pipeline_into, remove_result, search_links, download_videos,
+                       NoLinksFound)
@@ -0,0 +1,182 @@
+import os
+import time
+import logging
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Admission control for mashup jobs:
+#   - RateLimiter caps how many jobs one client can submit per window
+#   - CostBudget caps the total work (clips x seconds) running at once
+#   - JobCoalescer runs identical jobs once and keeps finished results for a TTL
+#   - CostReservation charges the budget only to the request that actually runs a job
+
+RATE_LIMIT = int(os.getenv('MASHUP_RATE_LIMIT', 5))
+RATE_WINDOW_SECONDS = int(os.getenv('MASHUP_RATE_WINDOW', 600))
+MAX_INFLIGHT_COST = int(os.getenv('MASHUP_MAX_INFLIGHT_COST', 50000))
+RESULT_TTL_SECONDS = int(os.getenv('MASHUP_RESULT_TTL', 1800))
+
+
+def job_key(singer_name, number_of_videos, duration, *options):
+    return (' '.join(singer_name.lower().split()), number_of_videos, duration) + options
+
+
+def estimate_cost(number_of_videos, duration):
+    return number_of_videos * duration
+
+
+class RateLimiter:
+    def __init__(self, limit=RATE_LIMIT, window=RATE_WINDOW_SECONDS):
+        self.limit = limit
+        self.window = window
+        self.requests = defaultdict(deque)
+        self.last_prune = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _prune(self, now):
+        # Forget clients with nothing left in the window, so one-off addresses don't pile up
+        for client in [c for c, history in self.requests.items() if not history or history[-1] <= now - self.window]:
+            del self.requests[client]
+        self.last_prune = now
+
+    def allow(self, client):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_prune >= self.window:
+                self._prune(now)
+            history = self.requests[client]
+            while history and history[0] <= now - self.window:
+                history.popleft()
+            if len(history) >= self.limit:
+                return False
+            history.append(now)
+            return True
+
+
+class CostBudget:
+    def __init__(self, max_cost=MAX_INFLIGHT_COST):
+        self.max_cost = max_cost
+        self.inflight = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, cost):
+        with self.lock:
+            if self.inflight + cost > self.max_cost:
+                return False
+            self.inflight += cost
+            return True
+
+    def release(self, cost):
+        with self.lock:
+            self.inflight -= cost
+
+
+class ServerBusy(Exception):
+    pass
+
+
+class CostReservation:
+    # One request's share of a CostBudget. Only the request that actually runs the
+    # pipeline pays; requests served by another execution or the cache give it back.
+    def __init__(self, budget, cost):
+        self.budget = budget
+        self.cost = cost
+        self.reserved = False
+
+    def admit(self, leader):
+        if leader and not self.reserved:
+            if not self.budget.reserve(self.cost):
+                raise ServerBusy("The server is busy with other mashups, try again later")
+            self.reserved = True
+        elif not leader:
+            self.release()
+
+    def release(self):
+        if self.reserved:
+            self.budget.release(self.cost)
+            self.reserved = False
+
+
+class _Execution:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class JobCoalescer:
+    def __init__(self, ttl=RESULT_TTL_SECONDS, on_evict=None, is_valid=None):
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.is_valid = is_valid
+        self.inflight = {}
+        self.results = {}
+        # Requests currently holding a key's result; those results are never evicted
+        self.users = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for key, (result, finished_at) in list(self.results.items()):
+            if self.users.get(key):
+                continue
+            if now - finished_at > self.ttl or (self.is_valid and not self.is_valid(result)):
+                del self.results[key]
+                if self.on_evict:
+                    self.on_evict(result)
+
+    def lookup(self, key):
+        # 'cached', 'inflight' or None. Only a hint: run() decides for real who executes.
+        with self.lock:
+            self._evict_expired()
+            if key in self.results:
+                return 'cached'
+            if key in self.inflight:
+                return 'inflight'
+            return None
+
+    @contextmanager
+    def run(self, key, func, admit=None):
+        # Yields the shared result and keeps it from being evicted until the block exits.
+        # admit(leader) is called once this call's role is known; it may raise to refuse
+        # running the job, in which case nothing is started.
+        with self.lock:
+            self._evict_expired()
+            cached = key in self.results
+            result = self.results[key][0] if cached else None
+            execution = None if cached else self.inflight.get(key)
+            leader = not cached and execution is None
+            if admit:
+                admit(leader)
+            if leader:
+                execution = self.inflight[key] = _Execution()
+            self.users[key] += 1
+
+        try:
+            if cached:
+                logging.info(f"Serving {key} from the result cache")
+                yield result
+            elif not leader:
+                logging.info(f"Attaching to in-flight job {key}")
+                execution.done.wait()
+                if execution.error is not None:
+                    raise execution.error
+                yield execution.result
+            else:
+                try:
+                    execution.result = func()
+                    with self.lock:
+                        self.results[key] = (execution.result, time.monotonic())
+                except Exception as e:
+                    execution.error = e
+                    raise
+                finally:
+                    with self.lock:
+                        del self.inflight[key]
+                    execution.done.set()
+                yield execution.result
+        finally:
+            with self.lock:
+                self.users[key] -= 1
+                if not self.users[key]:
+                    del self.users[key]
@@ -0,0 +1,58 @@
+import os
+import dataclasses
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .formats import DEFAULT_OUTPUT_FORMAT, validate_output
+from .memory import MemoryBudget, DOWNLOAD_FOOTPRINT
+from .registry import get_backend
+
+DEFAULT_SEARCH_BACKEND = 'ytdlp'
+DEFAULT_RENDER_BACKEND = 'pydub'
+
+
+@dataclass
+class PipelineConfig:
+    # Search
+    search_backend: str = DEFAULT_SEARCH_BACKEND
+    search_query: str = '{singer_name} official new video song'
+    extra_links: int = 10  # spare results in case some downloads fail or get filtered out
+
+    # Download
+    min_video_duration: int = 60
+    max_video_duration: int = 600
+
+    # Render
+    render_backend: str = DEFAULT_RENDER_BACKEND
+    output_format: str = DEFAULT_OUTPUT_FORMAT
+    bitrate: Optional[str] = None
+
+    # Where per-job working folders are created
+    work_dir: str = field(default_factory=os.getcwd)
+
+    # Memory-bounded mode; None runs every stage unbounded
+    memory_budget: Optional[MemoryBudget] = None
+
+    @classmethod
+    def from_env(cls, **overrides):
+        # MASHUP_MEMORY_BUDGET_MB turns on memory-bounded mode, MASHUP_SEARCH_BACKEND picks the search backend
+        settings = {
+            'memory_budget': MemoryBudget.from_env(),
+            'search_backend': os.getenv('MASHUP_SEARCH_BACKEND', DEFAULT_SEARCH_BACKEND),
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    def replace(self, **changes):
+        return dataclasses.replace(self, **changes)
+
+    def validate(self):
+        get_backend('search', self.search_backend)
+        get_backend('render', self.render_backend)
+        validate_output(self.output_format, self.bitrate)
+        return self
+
+    def download_workers(self):
+        if self.memory_budget is None:
+            return None
+        return self.memory_budget.max_workers(DOWNLOAD_FOOTPRINT)
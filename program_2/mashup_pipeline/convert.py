@@ -0,0 +1,32 @@
+import os
+import logging
+
+from .formats import INTERMEDIATE_CODEC, INTERMEDIATE_EXTENSION
+
+
+def convert_all_videos_to_audio(video_files, audio_folder):
+    # Imported here so the rest of the package (queue, admission, formats) works without MoviePy
+    from moviepy.editor import VideoFileClip
+
+    # Clear previous audio files
+    if os.path.exists(audio_folder):
+        for f in os.listdir(audio_folder):
+            os.remove(os.path.join(audio_folder, f))
+    else:
+        os.makedirs(audio_folder)
+    logging.info(f"Converting {len(video_files)} videos to audio.")
+
+    audio_files = []
+    for index, video_file in enumerate(video_files, start=1):
+        try:
+            video = VideoFileClip(video_file)
+            # Lossless intermediate: the only lossy encode is the final mashup export
+            audio_file = os.path.join(audio_folder, f'song_{index}{INTERMEDIATE_EXTENSION}')
+            video.audio.write_audiofile(audio_file, codec=INTERMEDIATE_CODEC, ffmpeg_params=["-loglevel", "quiet"])
+            video.close()
+            audio_files.append(audio_file)
+            logging.info(f"Converted {video_file} to {audio_file}")
+        except Exception as e:
+            logging.error(f"Error converting {video_file} to audio: {e}")
+
+    return audio_files
@@ -0,0 +1,160 @@
+import os
+import io
+import re
+import base64
+import logging
+import zipfile
+import smtplib
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.mime.base import MIMEBase
+from email import encoders, policy
+
+from .memory import create_zip_file
+
+SMTP_HOST = 'smtp.gmail.com'
+SMTP_PORT = 587
+
+# Input bytes per 76-character base64 line; streamed attachments are encoded in whole lines
+BASE64_LINE_BYTES = 57
+ATTACHMENT_PLACEHOLDER = 'MASHUP-ATTACHMENT-PLACEHOLDER'
+
+
+def zip_name_for(file_path):
+    return f"{os.path.splitext(os.path.basename(file_path))[0]}.zip"
+
+
+def create_zip(file_path):
+    logging.info(f"Creating zip for file: {file_path}")
+    zip_buffer = io.BytesIO()
+
+    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.write(file_path, os.path.basename(file_path))
+
+    zip_data = zip_buffer.getvalue()
+    logging.info(f"Zip file created for {file_path}, size: {len(zip_data)} bytes")
+    return zip_data
+
+
+def _sender_credentials():
+    sender_email = os.getenv('SENDER_EMAIL')
+    sender_password = os.getenv('SENDER_PASSWORD')
+    if not sender_email or not sender_password:
+        logging.error("Sender email or password not set in environment variables.")
+        return None
+    return sender_email, sender_password
+
+
+def _build_message(sender_email, email, zip_name):
+    msg = MIMEMultipart()
+    msg['From'] = sender_email
+    msg['To'] = email
+    msg['Subject'] = f"Your mashup: {zip_name}"
+
+    body = "Please find attached your requested mashup file."
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+def send_email(email, zip_data, zip_name):
+    logging.info(f"Sending email to: {email}")
+    credentials = _sender_credentials()
+    if credentials is None:
+        return False
+    sender_email, sender_password = credentials
+
+    msg = _build_message(sender_email, email, zip_name)
+
+    if zip_data is None or len(zip_data) == 0:
+        logging.error("No zip data to attach to email.")
+        return False
+
+    try:
+        part = MIMEBase("application", "octet-stream")
+        part.set_payload(zip_data)
+        encoders.encode_base64(part)
+        part.add_header("Content-Disposition", f"attachment; filename={zip_name}")
+        msg.attach(part)
+
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
+            server.starttls()
+            server.login(sender_email, sender_password)
+            server.send_message(msg)
+
+        logging.info("Email sent successfully.")
+        return True
+    except Exception as e:
+        logging.error(f"Error sending email: {e}")
+        return False
+
+
+def write_email_message(write, sender_email, email, zip_path, zip_name):
+    # Renders the message around a placeholder, then base64-encodes the zip into its place
+    # a block at a time, so neither the zip nor its encoding is ever in memory whole
+    msg = _build_message(sender_email, email, zip_name)
+    part = MIMEBase("application", "octet-stream")
+    part.set_payload(ATTACHMENT_PLACEHOLDER)
+    part.add_header("Content-Transfer-Encoding", "base64")
+    part.add_header("Content-Disposition", f"attachment; filename={zip_name}")
+    msg.attach(part)
+    head, tail = msg.as_bytes(policy=policy.SMTP).split(ATTACHMENT_PLACEHOLDER.encode())
+
+    write(head)
+    with open(zip_path, 'rb') as f:
+        separator = b''
+        for block in iter(lambda: f.read(BASE64_LINE_BYTES * 1024), b''):
+            write(separator + base64.encodebytes(block).replace(b'\n', b'\r\n').rstrip(b'\r\n'))
+            separator = b'\r\n'
+    write(tail if tail.endswith(b'\r\n') else tail + b'\r\n')
+
+
+def _expect(reply, *codes):
+    code, message = reply
+    if code not in codes:
+        raise smtplib.SMTPResponseException(code, message)
+
+
+def send_email_file(email, zip_path, zip_name):
+    # Same as send_email, but the attachment is read from disk and streamed to the server
+    logging.info(f"Sending email to: {email}")
+    credentials = _sender_credentials()
+    if credentials is None:
+        return False
+    sender_email, sender_password = credentials
+
+    if not os.path.exists(zip_path) or os.path.getsize(zip_path) == 0:
+        logging.error("No zip data to attach to email.")
+        return False
+
+    try:
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
+            server.starttls()
+            server.login(sender_email, sender_password)
+            _expect(server.mail(sender_email), 250)
+            _expect(server.rcpt(email), 250, 251)
+            server.putcmd('data')
+            _expect(server.getreply(), 354)
+            # Lines starting with "." must be doubled inside DATA (base64 never starts with one)
+            write_email_message(lambda data: server.send(re.sub(rb'(?m)^\.', b'..', data)),
+                                sender_email, email, zip_path, zip_name)
+            server.send(b'.\r\n')
+            _expect(server.getreply(), 250)
+
+        logging.info("Email sent successfully.")
+        return True
+    except Exception as e:
+        logging.error(f"Error sending email: {e}")
+        return False
+
+
+def deliver_mashup(email, file_path, zip_name, memory_budget=None):
+    # Zip the mashup and email it. Under a memory budget the zip is built on disk and
+    # streamed into the message; otherwise it is built in memory as before.
+    if memory_budget is None:
+        return send_email(email, create_zip(file_path), zip_name)
+
+    zip_path = create_zip_file(file_path)
+    try:
+        return send_email_file(email, zip_path, zip_name)
+    finally:
+        os.remove(zip_path)
@@ -0,0 +1,744 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import socket
+import threading
+from contextlib import closing, contextmanager
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+from .admission import ServerBusy, estimate_cost
+from .config import PipelineConfig
+from .convert import convert_all_videos_to_audio
+from .delivery import deliver_mashup, zip_name_for
+from .download import download_single_video
+from .formats import output_extension
+from .memory import create_mashup_streaming
+from .render import render, create_mashup
+
+# Coordinator/worker mode.
+# The web process searches for links and enqueues one "download" task per clip.
+# Workers (any number of processes, on any node that sees the queue and the
+# artifact store) pull tasks and push follow-ups:
+#   download -> convert (pydub backend only) -> mix -> deliver
+# Intermediate files are exchanged through a content-addressed ArtifactStore.
+
+MAX_ATTEMPTS = 3
+LEASE_SECONDS = 600
+POLL_SECONDS = 1.0
+# A worker that can't reach the queue waits this long at most between retries
+MAX_BACKOFF_SECONDS = 30
+
+# Artifacts nobody has written or read for this long are removed by the workers' sweep.
+# Keep it well above the longest job (LEASE_SECONDS x MAX_ATTEMPTS per stage).
+ARTIFACT_TTL = int(os.getenv('MASHUP_ARTIFACT_TTL', 24 * 3600))
+SWEEP_SECONDS = 600
+
+# Later stages first so running jobs finish before new ones start downloading
+TASK_PRIORITY = ('deliver', 'mix', 'convert', 'download')
+
+
+# Queue errors a worker outlives: a locked SQLite file, a Redis restart or network blip
+TRANSIENT_ERRORS = (sqlite3.OperationalError,)
+if redis is not None:
+    TRANSIENT_ERRORS += (redis.ConnectionError, redis.TimeoutError)
+
+
+class ArtifactStore:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def put(self, file_path):
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        key = sha.hexdigest() + os.path.splitext(file_path)[1]
+
+        destination = self.path(key)
+        if not os.path.exists(destination):
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            # Copy under a temporary name first so readers never see a partial file
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination))
+            os.close(fd)
+            shutil.copyfile(file_path, temp_path)
+            os.replace(temp_path, destination)
+        else:
+            # Another job produced the same file; keep it alive for this one too
+            os.utime(destination)
+        return key
+
+    def fetch(self, key, destination):
+        source = self.path(key)
+        os.utime(source)
+        shutil.copyfile(source, destination)
+        return destination
+
+    def sweep(self, max_age):
+        # Remove artifacts nobody has written or read for max_age seconds
+        cutoff = time.time() - max_age
+        removed = 0
+        for folder, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(folder, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    # Another worker swept it first
+                    continue
+        if removed:
+            logging.info(f"Removed {removed} expired artifacts from {self.root}")
+        return removed
+
+
+class SQLiteQueue:
+    def __init__(self, path, lease_seconds=LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        with closing(self._connect()) as db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    lease_until REAL,
+                    error TEXT
+                );
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS clips (
+                    job_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    artifact TEXT,
+                    PRIMARY KEY (job_id, idx)
+                );
+                CREATE TABLE IF NOT EXISTS stages (
+                    job_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    owner TEXT,
+                    PRIMARY KEY (job_id, stage)
+                );
+                CREATE TABLE IF NOT EXISTS job_keys (
+                    key TEXT PRIMARY KEY,
+                    job_id TEXT NOT NULL,
+                    cost INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS job_recipients (
+                    job_id TEXT NOT NULL,
+                    email TEXT NOT NULL
+                );
+            """)
+            if 'owner' not in [column[1] for column in db.execute("PRAGMA table_info(stages)")]:
+                try:
+                    db.execute("ALTER TABLE stages ADD COLUMN owner TEXT")
+                except sqlite3.OperationalError:
+                    # Another process added it between the check and the ALTER
+                    pass
+
+    def _connect(self):
+        # One short-lived connection per call keeps the queue safe to share between processes
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def put(self, kind, job_id, payload):
+        with closing(self._connect()) as db:
+            db.execute("INSERT INTO tasks (job_id, kind, payload) VALUES (?, ?, ?)",
+                       (job_id, kind, json.dumps(payload)))
+
+    def get(self, worker_id):
+        now = time.time()
+        priority = ' '.join(f"WHEN '{kind}' THEN {rank}" for rank, kind in enumerate(TASK_PRIORITY))
+        with closing(self._connect()) as db:
+            # BEGIN stays outside the try: if it fails there is no transaction to roll back
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT id, job_id, kind, payload, attempts FROM tasks "
+                    "WHERE status = 'pending' OR (status = 'running' AND lease_until < ?) "
+                    f"ORDER BY CASE kind {priority} END, id LIMIT 1",
+                    (now,)).fetchone()
+                if row is None:
+                    db.execute("COMMIT")
+                    return None
+                db.execute("UPDATE tasks SET status = 'running', worker = ?, lease_until = ?, "
+                           "attempts = attempts + 1 WHERE id = ?", (worker_id, now + self.lease_seconds, row[0]))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return {'id': row[0], 'job_id': row[1], 'kind': row[2],
+                'payload': json.loads(row[3]), 'attempts': row[4] + 1}
+
+    def extend_lease(self, task_id, worker_id):
+        # False once the task is no longer running under this worker's lease
+        with closing(self._connect()) as db:
+            cursor = db.execute("UPDATE tasks SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                                (time.time() + self.lease_seconds, task_id, worker_id))
+        return cursor.rowcount == 1
+
+    def ack(self, task_id):
+        with closing(self._connect()) as db:
+            db.execute("UPDATE tasks SET status = 'done' WHERE id = ?", (task_id,))
+
+    def fail(self, task_id, error):
+        # Returns True when the task was put back for another attempt
+        with closing(self._connect()) as db:
+            attempts = db.execute("SELECT attempts FROM tasks WHERE id = ?", (task_id,)).fetchone()[0]
+            status = 'pending' if attempts < MAX_ATTEMPTS else 'failed'
+            db.execute("UPDATE tasks SET status = ?, error = ? WHERE id = ?", (status, error, task_id))
+        return status == 'pending'
+
+    def _attach(self, db, key, email):
+        row = db.execute("SELECT job_id FROM job_keys WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        db.execute("INSERT INTO job_recipients (job_id, email) VALUES (?, ?)", (row[0], email))
+        return row[0]
+
+    def attach(self, key, email):
+        # Adds email to the running job with this key and returns its id, or None if there is none
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                job_id = self._attach(db, key, email)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def create_job(self, job_id, payload, key, cost=0, max_cost=None):
+        # Returns the id of the job that will serve this request: an identical running job
+        # if there is one, otherwise the new job. Raises ServerBusy when it doesn't fit max_cost.
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self._attach(db, key, payload['email'])
+                if existing is None:
+                    inflight = db.execute("SELECT COALESCE(SUM(cost), 0) FROM job_keys").fetchone()[0]
+                    if max_cost is not None and inflight + cost > max_cost:
+                        raise ServerBusy("The server is busy with other mashups, try again later")
+                    db.execute("INSERT INTO jobs (id, payload, status) VALUES (?, ?, 'queued')",
+                               (job_id, json.dumps(payload)))
+                    db.execute("INSERT INTO job_keys (key, job_id, cost) VALUES (?, ?, ?)", (key, job_id, cost))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return existing or job_id
+
+    def close_job(self, job_id):
+        # The job stops taking attachments and no longer counts against max_cost; idempotent
+        with closing(self._connect()) as db:
+            db.execute("DELETE FROM job_keys WHERE job_id = ?", (job_id,))
+
+    def recipients(self, job_id):
+        # Emails of the requests that attached to this job, besides its own
+        with closing(self._connect()) as db:
+            rows = db.execute("SELECT email FROM job_recipients WHERE job_id = ? ORDER BY rowid",
+                              (job_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def job(self, job_id):
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT payload, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(json.loads(row[0]), id=job_id, status=row[1])
+
+    def set_job_status(self, job_id, status, only_from=None):
+        # only_from makes the update conditional, so a late task can't move a finished job backwards
+        with closing(self._connect()) as db:
+            if only_from is None:
+                db.execute("UPDATE jobs SET status = ? WHERE id = ?", (status, job_id))
+            else:
+                db.execute("UPDATE jobs SET status = ? WHERE id = ? AND status = ?", (status, job_id, only_from))
+
+    def record_clip(self, job_id, index, artifact):
+        # Idempotent per clip; returns (successful clips, finished clips) for the job
+        with closing(self._connect()) as db:
+            db.execute("INSERT OR IGNORE INTO clips (job_id, idx, artifact) VALUES (?, ?, ?)",
+                       (job_id, index, artifact))
+            ok, done = db.execute("SELECT COUNT(artifact), COUNT(*) FROM clips WHERE job_id = ?",
+                                  (job_id,)).fetchone()
+        return ok, done
+
+    def clips(self, job_id):
+        with closing(self._connect()) as db:
+            rows = db.execute("SELECT idx, artifact FROM clips WHERE job_id = ? AND artifact IS NOT NULL",
+                              (job_id,)).fetchall()
+        return dict(rows)
+
+    def claim_stage(self, job_id, stage, owner=None):
+        # True for exactly one caller per (job, stage); with an owner, that owner's retries also get True
+        with closing(self._connect()) as db:
+            cursor = db.execute("INSERT OR IGNORE INTO stages (job_id, stage, owner) VALUES (?, ?, ?)",
+                                (job_id, stage, owner))
+            if cursor.rowcount == 1:
+                return True
+            if owner is None:
+                return False
+            row = db.execute("SELECT owner FROM stages WHERE job_id = ? AND stage = ?", (job_id, stage)).fetchone()
+        return row[0] == owner
+
+    def stage_claimed(self, job_id, stage):
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT 1 FROM stages WHERE job_id = ? AND stage = ?", (job_id, stage)).fetchone()
+        return row is not None
+
+
+# Pops a task and gives it a lease in the leases sorted set in one step, so
+# _requeue_expired never sees a claimed task without a fresh lease.
+# Only touches the keys it is given, as Dragonfly and Redis Cluster require.
+CLAIM_SCRIPT = """
+local task_id = redis.call('RPOP', KEYS[1])
+if not task_id then
+    return false
+end
+redis.call('ZADD', KEYS[2], ARGV[1], task_id)
+return task_id
+"""
+
+# Job keys map a running job's key to its id; recipients holds newline-separated extra emails per job
+ATTACH_SCRIPT = """
+local job_id = redis.call('HGET', KEYS[1], ARGV[1])
+if not job_id then
+    return false
+end
+local current = redis.call('HGET', KEYS[2], job_id)
+redis.call('HSET', KEYS[2], job_id, (current and current .. '\\n' or '') .. ARGV[2])
+return job_id
+"""
+
+# KEYS: job keys, recipients, job costs, the new job's hash
+# ARGV: key, email, job id, cost, max cost ('' for none), payload
+CREATE_JOB_SCRIPT = """
+local existing = redis.call('HGET', KEYS[1], ARGV[1])
+if existing then
+    local current = redis.call('HGET', KEYS[2], existing)
+    redis.call('HSET', KEYS[2], existing, (current and current .. '\\n' or '') .. ARGV[2])
+    return existing
+end
+if ARGV[5] ~= '' then
+    local inflight = 0
+    for _, cost in ipairs(redis.call('HVALS', KEYS[3])) do
+        inflight = inflight + tonumber(cost)
+    end
+    if inflight + tonumber(ARGV[4]) > tonumber(ARGV[5]) then
+        return false
+    end
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+redis.call('HSET', KEYS[3], ARGV[3], ARGV[4])
+redis.call('HSET', KEYS[4], 'payload', ARGV[6], 'status', 'queued', 'key', ARGV[1])
+return ARGV[3]
+"""
+
+# KEYS: job keys, job costs, the job's hash; ARGV: job id
+CLOSE_JOB_SCRIPT = """
+local key = redis.call('HGET', KEYS[3], 'key')
+if key and redis.call('HGET', KEYS[1], key) == ARGV[1] then
+    redis.call('HDEL', KEYS[1], key)
+end
+redis.call('HDEL', KEYS[2], ARGV[1])
+"""
+
+SET_STATUS_FROM_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'status') == ARGV[1] then
+    redis.call('HSET', KEYS[1], 'status', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class RedisQueue:
+    def __init__(self, url, lease_seconds=LEASE_SECONDS, prefix='mashup'):
+        if redis is None:
+            raise ImportError("The redis package is required for redis:// queue URLs (pip install redis).")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.lease_seconds = lease_seconds
+        # The hash tag keeps every queue key in one Redis Cluster slot, so scripts can use them together
+        self.prefix = f"{{{prefix}}}"
+        self.claim = self.client.register_script(CLAIM_SCRIPT)
+        self.set_status_from = self.client.register_script(SET_STATUS_FROM_SCRIPT)
+        self.attach_script = self.client.register_script(ATTACH_SCRIPT)
+        self.create_job_script = self.client.register_script(CREATE_JOB_SCRIPT)
+        self.close_job_script = self.client.register_script(CLOSE_JOB_SCRIPT)
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + tuple(str(p) for p in parts))
+
+    def put(self, kind, job_id, payload):
+        task_id = self.client.incr(self._key('task_id'))
+        self.client.hset(self._key('task', task_id), mapping={
+            'job_id': job_id, 'kind': kind, 'payload': json.dumps(payload), 'attempts': 0,
+        })
+        self.client.lpush(self._key('queue', kind), task_id)
+
+    def _requeue_expired(self):
+        # Only a lease that has run out marks an abandoned task
+        for task_id in self.client.zrangebyscore(self._key('leases'), '-inf', time.time()):
+            # Whoever removes the lease puts the task back, so it is requeued once
+            if self.client.zrem(self._key('leases'), task_id):
+                kind = self.client.hget(self._key('task', task_id), 'kind')
+                if kind:
+                    self.client.lpush(self._key('queue', kind), task_id)
+
+    def get(self, worker_id):
+        self._requeue_expired()
+        for kind in TASK_PRIORITY:
+            task_id = self.claim(keys=[self._key('queue', kind), self._key('leases')],
+                                 args=[time.time() + self.lease_seconds])
+            if task_id is None:
+                continue
+            key = self._key('task', task_id)
+            self.client.hincrby(key, 'attempts', 1)
+            self.client.hset(key, 'worker', worker_id)
+            task = self.client.hgetall(key)
+            return {'id': task_id, 'job_id': task['job_id'], 'kind': task['kind'],
+                    'payload': json.loads(task['payload']), 'attempts': int(task['attempts'])}
+        return None
+
+    def extend_lease(self, task_id, worker_id):
+        # XX only updates a lease that still exists; a requeued task has lost it
+        if self.client.hget(self._key('task', task_id), 'worker') != worker_id:
+            return False
+        self.client.zadd(self._key('leases'), {task_id: time.time() + self.lease_seconds}, xx=True)
+        return self.client.zscore(self._key('leases'), task_id) is not None
+
+    def ack(self, task_id):
+        self.client.zrem(self._key('leases'), task_id)
+        self.client.delete(self._key('task', task_id))
+
+    def fail(self, task_id, error):
+        key = self._key('task', task_id)
+        # The attempt is over, don't leave its lease behind for the next claim
+        self.client.zrem(self._key('leases'), task_id)
+        self.client.hdel(key, 'worker')
+        task = self.client.hgetall(key)
+        if int(task.get('attempts', 0)) < MAX_ATTEMPTS:
+            self.client.hset(key, 'error', error)
+            self.client.lpush(self._key('queue', task['kind']), task_id)
+            return True
+        self.client.delete(key)
+        return False
+
+    def attach(self, key, email):
+        return self.attach_script(keys=[self._key('job_keys'), self._key('recipients')], args=[key, email])
+
+    def create_job(self, job_id, payload, key, cost=0, max_cost=None):
+        result = self.create_job_script(
+            keys=[self._key('job_keys'), self._key('recipients'), self._key('job_costs'), self._key('job', job_id)],
+            args=[key, payload['email'], job_id, cost, '' if max_cost is None else max_cost, json.dumps(payload)])
+        if result is None:
+            raise ServerBusy("The server is busy with other mashups, try again later")
+        return result
+
+    def close_job(self, job_id):
+        self.close_job_script(keys=[self._key('job_keys'), self._key('job_costs'), self._key('job', job_id)],
+                              args=[job_id])
+
+    def recipients(self, job_id):
+        emails = self.client.hget(self._key('recipients'), job_id)
+        return emails.split('\n') if emails else []
+
+    def job(self, job_id):
+        job = self.client.hgetall(self._key('job', job_id))
+        if not job:
+            return None
+        return dict(json.loads(job['payload']), id=job_id, status=job['status'])
+
+    def set_job_status(self, job_id, status, only_from=None):
+        if only_from is None:
+            self.client.hset(self._key('job', job_id), 'status', status)
+        else:
+            self.set_status_from(keys=[self._key('job', job_id)], args=[only_from, status])
+
+    def record_clip(self, job_id, index, artifact):
+        key = self._key('job', job_id, 'clips')
+        self.client.hsetnx(key, index, artifact or '')
+        clips = self.client.hvals(key)
+        return sum(1 for a in clips if a), len(clips)
+
+    def clips(self, job_id):
+        clips = self.client.hgetall(self._key('job', job_id, 'clips'))
+        return {int(index): artifact for index, artifact in clips.items() if artifact}
+
+    def claim_stage(self, job_id, stage, owner=None):
+        key = self._key('job', job_id, 'stage', stage)
+        if self.client.set(key, owner or '', nx=True):
+            return True
+        return owner is not None and self.client.get(key) == owner
+
+    def stage_claimed(self, job_id, stage):
+        return bool(self.client.exists(self._key('job', job_id, 'stage', stage)))
+
+
+def open_queue(url):
+    # sqlite:///path/to/queue.db for a single machine or a shared filesystem,
+    # redis://host:6379/0 (or any Redis-compatible server) across nodes
+    if url.startswith('sqlite:///'):
+        return SQLiteQueue(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisQueue(url)
+    raise ValueError(f"Unsupported queue URL: {url}")
+
+
+def _queue_key(key):
+    # job_key() tuples as stored in the queue
+    return json.dumps(list(key))
+
+
+def attach_to_job(queue, key, email):
+    # Returns the id of a running identical job that will also email this address, or None
+    job_id = queue.attach(_queue_key(key), email)
+    if job_id:
+        logging.info(f"Attached {email} to running job {job_id}")
+    return job_id
+
+
+def submit_job(queue, links, singer_name, number_of_videos, duration, email, config, key=None, max_cost=None):
+    # Identical jobs (same key) coalesce into one; a new job is refused with ServerBusy
+    # while running jobs already cost more than max_cost. Without a key nothing coalesces.
+    payload = {
+        'singer_name': singer_name,
+        'number_of_videos': number_of_videos,
+        'duration': duration,
+        'email': email,
+        'render_backend': config.render_backend,
+        'output_format': config.output_format,
+        'bitrate': config.bitrate,
+        'min_video_duration': config.min_video_duration,
+        'max_video_duration': config.max_video_duration,
+        'total_clips': len(links),
+    }
+    new_job_id = uuid.uuid4().hex
+    job_id = queue.create_job(new_job_id, payload, _queue_key(key) if key is not None else new_job_id,
+                              cost=estimate_cost(number_of_videos, duration), max_cost=max_cost)
+    if job_id != new_job_id:
+        logging.info(f"Attached {email} to running job {job_id}")
+        return job_id
+    for index, url in enumerate(links, start=1):
+        queue.put('download', job_id, {'url': url, 'index': index})
+    logging.info(f"Queued job {job_id} with {len(links)} download tasks")
+    return job_id
+
+
+def job_config(job):
+    # The worker's own environment decides memory limits, the job decides what to render
+    return PipelineConfig.from_env(
+        render_backend=job['render_backend'],
+        output_format=job['output_format'],
+        bitrate=job['bitrate'],
+        min_video_duration=job['min_video_duration'],
+        max_video_duration=job['max_video_duration'],
+    )
+
+
+def _schedule_mix(queue, job, ok, done):
+    if ok < job['number_of_videos'] and done < job['total_clips']:
+        return
+    if not queue.claim_stage(job['id'], 'mix'):
+        return
+    if ok == 0:
+        logging.error(f"Job {job['id']}: no clips could be downloaded")
+        _fail_job(queue, job)
+        return
+    queue.set_job_status(job['id'], 'mixing')
+    queue.put('mix', job['id'], {})
+
+
+def _fail_job(queue, job):
+    queue.set_job_status(job['id'], 'failed')
+    queue.close_job(job['id'])
+    recipients = queue.recipients(job['id'])
+    if recipients:
+        logging.error(f"Job {job['id']}: failed for attached requests too: {', '.join(recipients)}")
+
+
+def _record_clip(queue, job, index, artifact):
+    ok, done = queue.record_clip(job['id'], index, artifact)
+    _schedule_mix(queue, job, ok, done)
+
+
+def handle_download(queue, store, job, payload, work_dir):
+    if queue.stage_claimed(job['id'], 'mix'):
+        # Enough clips already arrived from other workers
+        return
+    queue.set_job_status(job['id'], 'running', only_from='queued')
+
+    video_file = download_single_video(payload['url'], payload['index'], work_dir,
+                                       job['max_video_duration'], job['min_video_duration'])
+    if not video_file:
+        _record_clip(queue, job, payload['index'], None)
+        return
+
+    artifact = store.put(video_file)
+    if job['render_backend'] == 'pydub':
+        queue.put('convert', job['id'], {'index': payload['index'], 'artifact': artifact})
+    else:
+        # Other backends render straight from the downloads
+        _record_clip(queue, job, payload['index'], artifact)
+
+
+def handle_convert(queue, store, job, payload, work_dir):
+    video_file = store.fetch(payload['artifact'], os.path.join(work_dir, payload['artifact']))
+    audio_files = convert_all_videos_to_audio([video_file], os.path.join(work_dir, 'audio'))
+
+    artifact = store.put(audio_files[0]) if audio_files else None
+    _record_clip(queue, job, payload['index'], artifact)
+
+
+def handle_mix(queue, store, job, payload, work_dir):
+    config = job_config(job)
+    clips = queue.clips(job['id'])
+    selected = [clips[index] for index in sorted(clips)][:job['number_of_videos']]
+
+    output_filename = f"{job['singer_name'].replace(' ', '_')}_mashup{output_extension(config.output_format)}"
+    output_path = os.path.join(work_dir, output_filename)
+    input_folder = os.path.join(work_dir, 'clips')
+    os.makedirs(input_folder)
+    input_files = [
+        store.fetch(artifact, os.path.join(input_folder, f"song_{position}{os.path.splitext(artifact)[1]}"))
+        for position, artifact in enumerate(selected, start=1)
+    ]
+
+    if job['render_backend'] != 'pydub':
+        render(input_files, os.path.join(work_dir, 'audios'), output_path, job['duration'], config)
+    elif config.memory_budget is not None:
+        # Clips were already converted by convert tasks, only the mix is left
+        create_mashup_streaming(input_files, output_path, job['duration'], config.memory_budget,
+                                config.output_format, config.bitrate)
+    else:
+        create_mashup(input_files, output_path, job['duration'], config.output_format, config.bitrate)
+
+    # The delivery id lets retries of this deliver task through, but no second deliver task
+    queue.put('deliver', job['id'], {'artifact': store.put(output_path), 'filename': output_filename,
+                                     'delivery_id': uuid.uuid4().hex})
+
+
+def handle_deliver(queue, store, job, payload, work_dir):
+    if job['status'] == 'done':
+        # An earlier attempt sent it but could not ack
+        return
+    if not queue.claim_stage(job['id'], 'deliver', owner=payload.get('delivery_id', 'deliver')):
+        logging.info(f"Job {job['id']}: already delivered by another task")
+        return
+    config = job_config(job)
+    output_path = store.fetch(payload['artifact'], os.path.join(work_dir, payload['filename']))
+    # Closing first means every request that attached is in recipients() below
+    queue.close_job(job['id'])
+    if not deliver_mashup(job['email'], output_path, zip_name_for(output_path), config.memory_budget):
+        raise RuntimeError(f"Failed to send mashup to {job['email']}")
+    logging.info(f"Job {job['id']}: mashup sent to {job['email']}")
+    # The job's own email went out, so a retry would send it twice; attached requests only log failures
+    for email in queue.recipients(job['id']):
+        if deliver_mashup(email, output_path, zip_name_for(output_path), config.memory_budget):
+            logging.info(f"Job {job['id']}: mashup sent to {email}")
+        else:
+            logging.error(f"Job {job['id']}: failed to send mashup to {email}")
+    queue.set_job_status(job['id'], 'done')
+
+
+TASK_HANDLERS = {
+    'download': handle_download,
+    'convert': handle_convert,
+    'mix': handle_mix,
+    'deliver': handle_deliver,
+}
+
+
+def _give_up(queue, job, task):
+    if task['kind'] in ('download', 'convert'):
+        _record_clip(queue, job, task['payload']['index'], None)
+    else:
+        _fail_job(queue, job)
+
+
+@contextmanager
+def heartbeat(queue, task_id, worker_id):
+    # Renews the task's lease while its handler runs, so long renders aren't handed to another worker
+    stopped = threading.Event()
+
+    def beat():
+        while not stopped.wait(queue.lease_seconds / 3):
+            try:
+                if not queue.extend_lease(task_id, worker_id):
+                    logging.warning(f"Worker {worker_id}: lost the lease on task {task_id}")
+                    return
+            except TRANSIENT_ERRORS as e:
+                logging.warning(f"Worker {worker_id}: could not renew the lease on task {task_id}: {e}")
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run_task(queue, store, job, task, worker_id):
+    logging.info(f"Worker {worker_id}: {task['kind']} task {task['id']} for job {task['job_id']}")
+    try:
+        with heartbeat(queue, task['id'], worker_id):
+            with tempfile.TemporaryDirectory(prefix=f"mashup_{task['kind']}_") as work_dir:
+                TASK_HANDLERS[task['kind']](queue, store, job, task['payload'], work_dir)
+    except Exception as e:
+        logging.error(f"Worker {worker_id}: {task['kind']} task {task['id']} failed: {e}")
+        if not queue.fail(task['id'], str(e)):
+            _give_up(queue, job, task)
+        return
+    queue.ack(task['id'])
+
+
+def run_worker(queue_url, store_root, worker_id=None, stop_when_idle=False, artifact_ttl=ARTIFACT_TTL):
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    queue = open_queue(queue_url)
+    store = ArtifactStore(store_root)
+    logging.info(f"Worker {worker_id} polling {queue_url}")
+
+    last_sweep = 0
+    backoff = POLL_SECONDS
+    while True:
+        if time.time() - last_sweep >= SWEEP_SECONDS:
+            store.sweep(artifact_ttl)
+            last_sweep = time.time()
+
+        try:
+            task = queue.get(worker_id)
+            if task is None:
+                if stop_when_idle:
+                    return
+                time.sleep(POLL_SECONDS)
+                continue
+            run_task(queue, store, queue.job(task['job_id']), task, worker_id)
+        except TRANSIENT_ERRORS as e:
+            # A task caught mid-way keeps its lease and is picked up again once the lease runs out
+            logging.warning(f"Worker {worker_id}: queue unavailable ({e}), retrying in {backoff:.0f}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+            continue
+        backoff = POLL_SECONDS
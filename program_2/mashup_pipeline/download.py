@@ -0,0 +1,90 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def download_single_video(url, index, download_path, max_duration=600, min_duration=60):
+    # Imported here so the rest of the package works without yt-dlp installed
+    import yt_dlp
+
+    logging.info(f"Attempting to download video {index}: {url}")
+    ydl_opts = {
+        'format': 'bestvideo[height<=480]+bestaudio/best',
+        'outtmpl': os.path.join(download_path, f'video_{index}.%(ext)s'),
+        'quiet': True,
+        'no_warnings': True,
+        'match_filter': lambda info: 'This video is either too long or too short'
+        if info.get('duration', 0) > max_duration or info.get('duration', 0) < min_duration else None
+    }
+
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+
+            # Check video duration
+            duration = info.get('duration', 0)
+            logging.debug(f"Video duration for {url}: {duration} seconds")
+            if duration > max_duration:
+                logging.info(f"Skipping {url}: Video longer than {max_duration} seconds")
+                return None
+            elif duration < min_duration:
+                logging.info(f"Skipping {url}: Video shorter than {min_duration} seconds")
+                return None
+
+            # Download the video if duration is valid
+            filename = ydl.prepare_filename(info)
+            logging.info(f"Downloading video to {filename}")
+            ydl.download([url])
+
+            if os.path.exists(filename):
+                logging.info(f"Successfully downloaded: {filename}")
+                return filename
+            else:
+                logging.error(f"File not found after download: {filename}")
+                return None
+    except yt_dlp.utils.DownloadError as e:
+        if "This video is either too long or too short" in str(e):
+            logging.info(f"Skipped {url}: Video duration does not meet criteria")
+        else:
+            logging.error(f"Error downloading video {url}: {str(e)}")
+        return None
+    except Exception as e:
+        logging.error(f"Unexpected error downloading video {url}: {str(e)}")
+        return None
+
+
+def download_all_videos(video_urls, download_path, number_of_videos, max_duration=600, min_duration=60,
+                        max_workers=None):
+    os.makedirs(download_path, exist_ok=True)
+    logging.info(f"Starting download for {len(video_urls)} videos with max duration {max_duration}")
+    downloaded_files = {}
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {
+            executor.submit(download_single_video, url, index, download_path, max_duration, min_duration): index
+            for index, url in enumerate(video_urls, start=1)
+        }
+
+        for future in as_completed(futures):
+            try:
+                video_file = future.result()
+                if video_file:
+                    downloaded_files[futures[future]] = video_file
+                    logging.info(f"Downloaded {len(downloaded_files)} files.")
+
+                    # Stop downloading when we've reached the required number of videos
+                    if len(downloaded_files) == number_of_videos:
+                        logging.info("Reached the desired number of videos.")
+                        break
+            except Exception as e:
+                logging.error(f"Error occurred: {e}")
+    finally:
+        # Don't start the spare downloads once we have enough
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    # Check if we got the desired number of videos
+    if len(downloaded_files) < number_of_videos:
+        logging.error(f"Only {len(downloaded_files)} videos downloaded out of {number_of_videos} requested.")
+
+    # Keep search order so the mashup order doesn't depend on which download finished first
+    return [downloaded_files[index] for index in sorted(downloaded_files)]
@@ -0,0 +1,69 @@
+import os
+import json
+import logging
+import subprocess
+
+from .formats import encoder_args, DEFAULT_OUTPUT_FORMAT
+
+# Every clip is normalised to this layout so concat can join them
+SAMPLE_FORMAT = 'aformat=sample_fmts=fltp:sample_rates=44100:channel_layouts=stereo'
+
+
+def has_audio_stream(path):
+    command = [
+        'ffprobe', '-v', 'error', '-select_streams', 'a',
+        '-show_entries', 'stream=index', '-of', 'json', path,
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, check=True)
+        return bool(json.loads(result.stdout).get('streams'))
+    except (subprocess.CalledProcessError, ValueError, OSError) as e:
+        logging.error(f"Could not probe {path}: {e}")
+        return False
+
+
+def build_mashup_filter(number_of_inputs, duration):
+    chains = []
+    for i in range(number_of_inputs):
+        # Cut to `duration` seconds, reset timestamps and pad short clips with silence
+        chains.append(
+            f"[{i}:a:0]atrim=duration={duration},asetpts=PTS-STARTPTS,"
+            f"{SAMPLE_FORMAT},apad=whole_dur={duration}[a{i}]"
+        )
+
+    inputs = ''.join(f"[a{i}]" for i in range(number_of_inputs))
+    chains.append(f"{inputs}concat=n={number_of_inputs}:v=0:a=1[out]")
+
+    return ';'.join(chains)
+
+
+def build_ffmpeg_mashup_command(input_files, output_file, duration, output_format=DEFAULT_OUTPUT_FORMAT,
+                                bitrate=None):
+    command = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error']
+    for input_file in input_files:
+        command += ['-i', input_file]
+    command += [
+        '-filter_complex', build_mashup_filter(len(input_files), duration),
+        '-map', '[out]',
+    ] + encoder_args(output_format, bitrate) + [output_file]
+    return command
+
+
+def create_mashup_ffmpeg(input_files, output_file, duration, output_format=DEFAULT_OUTPUT_FORMAT, bitrate=None):
+    input_files = [f for f in input_files if has_audio_stream(f)]
+    if not input_files:
+        raise ValueError("None of the downloaded files contain an audio stream.")
+
+    logging.info(f"Rendering mashup of {len(input_files)} files with ffmpeg, {duration} seconds each.")
+    output_dir = os.path.dirname(output_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    command = build_ffmpeg_mashup_command(input_files, output_file, duration, output_format, bitrate)
+    try:
+        subprocess.run(command, capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        logging.error(f"ffmpeg render failed: {e.stderr.strip()}")
+        raise
+
+    logging.info(f'Mashup saved as {output_file}')
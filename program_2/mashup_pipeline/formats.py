@@ -0,0 +1,79 @@
+import os
+
+# Final output encodings. Intermediates are always lossless (WAV or stream copies),
+# so the mashup is encoded exactly once, with these arguments, whichever backend renders it.
+#   extension -> file extension of the mashup
+#   muxer     -> ffmpeg container format
+#   codec     -> ffmpeg audio encoder
+#   bitrate   -> default bitrate (None keeps the encoder default)
+#   quality   -> VBR quality instead of a bitrate
+#   sample_fmt -> encoder sample format, where the encoder's default isn't what we want
+OUTPUT_FORMATS = {
+    'mp3': {'extension': '.mp3', 'muxer': 'mp3', 'codec': 'libmp3lame', 'bitrate': None},
+    'mp3-vbr': {'extension': '.mp3', 'muxer': 'mp3', 'codec': 'libmp3lame', 'quality': '2'},
+    'opus': {'extension': '.opus', 'muxer': 'opus', 'codec': 'libopus', 'bitrate': '96k'},
+    'aac': {'extension': '.m4a', 'muxer': 'ipod', 'codec': 'aac', 'bitrate': '160k'},
+    # The mix is 16-bit PCM; without this the FLAC encoder picks 24-bit from the float mix
+    'flac': {'extension': '.flac', 'muxer': 'flac', 'codec': 'flac', 'sample_fmt': 's16'},
+}
+DEFAULT_OUTPUT_FORMAT = 'mp3'
+
+# Bitrates every lossy encoder above accepts
+BITRATES = ('64k', '96k', '128k', '160k', '192k', '256k', '320k')
+
+# Typical average kbps of each LAME VBR quality level (-q:a 0 is the best), used to turn
+# a requested bitrate into a VBR level instead of forcing CBR
+LAME_VBR_KBPS = {0: 245, 1: 225, 2: 190, 3: 175, 4: 165, 5: 130, 6: 115, 7: 100, 8: 85, 9: 65}
+
+# Lossless intermediate written by the MoviePy conversion step
+INTERMEDIATE_CODEC = 'pcm_s16le'
+INTERMEDIATE_EXTENSION = '.wav'
+
+
+def output_extension(output_format):
+    return OUTPUT_FORMATS[output_format]['extension']
+
+
+def format_for_filename(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.aac':
+        return 'aac'
+    for name, settings in OUTPUT_FORMATS.items():
+        if settings['extension'] == extension:
+            return name
+    return DEFAULT_OUTPUT_FORMAT
+
+
+def filename_for_format(filename, output_format):
+    # Keep the name but make the extension match what will actually be written
+    # (a .aac name for the aac format becomes .m4a, since it is written in an MP4 container)
+    base, extension = os.path.splitext(filename)
+    if extension.lower() == output_extension(output_format):
+        return filename
+    return base + output_extension(output_format)
+
+
+def vbr_quality(bitrate):
+    kbps = int(bitrate[:-1])
+    return str(min(LAME_VBR_KBPS, key=lambda level: abs(LAME_VBR_KBPS[level] - kbps)))
+
+
+def validate_output(output_format, bitrate=None):
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Output format must be one of: {', '.join(OUTPUT_FORMATS)}")
+    if bitrate and bitrate not in BITRATES:
+        raise ValueError(f"Bitrate must be one of: {', '.join(BITRATES)}")
+
+
+def encoder_args(output_format=DEFAULT_OUTPUT_FORMAT, bitrate=None):
+    # The same ffmpeg arguments are used by every render path
+    settings = OUTPUT_FORMATS[output_format]
+    args = ['-c:a', settings['codec']]
+    if 'quality' in settings:
+        # A VBR format stays VBR; a bitrate only picks the nearest quality level
+        args += ['-q:a', vbr_quality(bitrate) if bitrate else settings['quality']]
+    elif settings['codec'] != 'flac' and (bitrate or settings.get('bitrate')):
+        args += ['-b:a', bitrate or settings['bitrate']]
+    if 'sample_fmt' in settings:
+        args += ['-sample_fmt', settings['sample_fmt']]
+    return args + ['-f', settings['muxer']]
@@ -0,0 +1,290 @@
+import os
+import gc
+import sys
+import time
+import zipfile
+import logging
+import resource
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .ffmpeg_render import create_mashup_ffmpeg
+from .formats import encoder_args, DEFAULT_OUTPUT_FORMAT
+
+# Memory-bounded mode for small serverless instances.
+# Set MASHUP_MEMORY_BUDGET_MB to switch every stage to a streaming implementation:
+#   - downloads and audio extraction run only as many at once as the budget allows
+#   - extraction is an ffmpeg stream copy trimmed to the clip duration (no MoviePy decode)
+#   - the mashup is decoded clip by clip in small PCM chunks piped into a single encoder
+#   - the zip is written to disk and streamed into the email, never held in memory whole
+# When RSS gets close to the budget, chunks shrink and new work waits instead of piling up.
+# RSS here is this process plus its ffmpeg/yt-dlp children, which do most of the work.
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+BYTES_PER_SECOND = SAMPLE_RATE * CHANNELS * 2  # s16le PCM
+
+# Rough peak footprints used to decide how much can run at once
+DOWNLOAD_FOOTPRINT = 64 * 1024 * 1024        # yt-dlp download + merge
+FFMPEG_FOOTPRINT = 32 * 1024 * 1024          # one ffmpeg decode/encode process
+FFMPEG_INPUT_FOOTPRINT = 16 * 1024 * 1024    # each extra input of a multi-input ffmpeg graph
+
+MIN_CHUNK_SECONDS = 1
+MAX_CHUNK_SECONDS = 30
+PRESSURE_RATIO = 0.9
+
+
+def _statm_rss(pid):
+    with open(f'/proc/{pid}/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def current_rss():
+    try:
+        return _statm_rss('self')
+    except (OSError, ValueError, IndexError):
+        # No procfs (macOS); the peak is the best we can do there
+        return peak_rss()
+
+
+def _child_pids():
+    # Parent pid -> child pids for every process visible in /proc
+    children = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces and parentheses; the fields after the last ')' don't
+        parent = int(stat.rsplit(')', 1)[1].split()[1])
+        children.setdefault(parent, []).append(int(name))
+    return children
+
+
+def children_rss():
+    # Resident memory of every descendant process (ffmpeg, yt-dlp merges)
+    try:
+        tree = _child_pids()
+    except OSError:
+        # No procfs; the reserved footprints are all there is to go on
+        return 0
+    total = 0
+    pending = list(tree.get(os.getpid(), []))
+    while pending:
+        pid = pending.pop()
+        try:
+            total += _statm_rss(pid)
+        except (OSError, ValueError, IndexError):
+            # Exited while we were looking
+            pass
+        pending.extend(tree.get(pid, []))
+    return total
+
+
+def tree_rss():
+    return current_rss() + children_rss()
+
+
+def peak_rss():
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class MemoryBudget:
+    def __init__(self, limit_bytes):
+        self.limit = limit_bytes
+        self.reserved = 0
+        self.condition = threading.Condition()
+
+    @classmethod
+    def from_env(cls):
+        budget_mb = os.getenv('MASHUP_MEMORY_BUDGET_MB')
+        return cls(int(budget_mb) * 1024 * 1024) if budget_mb else None
+
+    def headroom(self):
+        return max(0, self.limit - tree_rss())
+
+    def under_pressure(self):
+        return tree_rss() > self.limit * PRESSURE_RATIO
+
+    def max_workers(self, footprint, default=None):
+        default = default or min(32, (os.cpu_count() or 1) + 4)
+        workers = max(1, min(default, self.headroom() // footprint))
+        logging.info(f"Memory budget allows {workers} concurrent tasks of ~{footprint // (1024 * 1024)} MB")
+        return workers
+
+    def chunk_bytes(self):
+        # An eighth of the headroom per read, rounded to whole PCM frames
+        seconds = self.headroom() / 8 / BYTES_PER_SECOND
+        seconds = max(MIN_CHUNK_SECONDS, min(MAX_CHUNK_SECONDS, seconds))
+        return int(seconds * SAMPLE_RATE) * CHANNELS * 2
+
+    @contextmanager
+    def reserve(self, footprint):
+        with self.condition:
+            # Always let one task through so a tight budget slows the job down instead of deadlocking it
+            while self.reserved and (self.reserved + footprint > self.limit
+                                     or tree_rss() + footprint > self.limit):
+                self.condition.wait(timeout=1)
+            self.reserved += footprint
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.reserved -= footprint
+                self.condition.notify_all()
+
+    def relieve_pressure(self):
+        if self.under_pressure():
+            gc.collect()
+            logging.warning(f"RSS {tree_rss() // (1024 * 1024)} MB is close to the "
+                            f"{self.limit // (1024 * 1024)} MB budget, slowing down")
+            time.sleep(0.1)
+
+
+def extract_audio(video_file, audio_file, duration=None):
+    # Stream copy the audio track into Matroska: no decode, no re-encode, bounded memory
+    command = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-i', video_file, '-vn', '-map', '0:a:0']
+    if duration:
+        command += ['-t', str(duration)]
+    command += ['-c:a', 'copy', audio_file]
+    subprocess.run(command, capture_output=True, text=True, check=True)
+    return audio_file
+
+
+def extract_all_audio(video_files, audio_folder, budget, duration=None):
+    os.makedirs(audio_folder, exist_ok=True)
+    logging.info(f"Extracting audio from {len(video_files)} videos within the memory budget.")
+
+    def extract(index, video_file):
+        with budget.reserve(FFMPEG_FOOTPRINT):
+            return extract_audio(video_file, os.path.join(audio_folder, f'song_{index}.mka'), duration)
+
+    audio_files = {}
+    with ThreadPoolExecutor(max_workers=budget.max_workers(FFMPEG_FOOTPRINT)) as executor:
+        futures = {
+            executor.submit(extract, index, video_file): index
+            for index, video_file in enumerate(video_files, start=1)
+        }
+        for future in as_completed(futures):
+            try:
+                audio_files[futures[future]] = future.result()
+            except Exception as e:
+                logging.error(f"Error extracting audio from {video_files[futures[future] - 1]}: {e}")
+
+    return [audio_files[index] for index in sorted(audio_files)]
+
+
+def create_mashup_streaming(input_files, output_file, duration, budget,
+                            output_format=DEFAULT_OUTPUT_FORMAT, bitrate=None):
+    # Decode one clip at a time into fixed-size PCM chunks and pipe them into one encoder,
+    # so memory stays at a chunk or two no matter how many clips or how long each one is
+    logging.info(f"Streaming mashup of {len(input_files)} files, {duration} seconds each.")
+    output_dir = os.path.dirname(output_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    clip_bytes = duration * BYTES_PER_SECOND
+    pcm = ['-f', 's16le', '-ac', str(CHANNELS), '-ar', str(SAMPLE_RATE)]
+    encoder = subprocess.Popen(
+        ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error'] + pcm + ['-i', '-']
+        + encoder_args(output_format, bitrate) + [output_file],
+        stdin=subprocess.PIPE,
+    )
+
+    clips_written = 0
+    try:
+        with budget.reserve(2 * FFMPEG_FOOTPRINT):
+            for input_file in input_files:
+                decoder = subprocess.Popen(
+                    ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', input_file,
+                     '-t', str(duration), '-map', '0:a:0'] + pcm + ['-'],
+                    stdout=subprocess.PIPE,
+                )
+                try:
+                    written = 0
+                    while written < clip_bytes:
+                        chunk = decoder.stdout.read(min(budget.chunk_bytes(), clip_bytes - written))
+                        if not chunk:
+                            break
+                        encoder.stdin.write(chunk)
+                        written += len(chunk)
+                        budget.relieve_pressure()
+                finally:
+                    # Also reached when the encoder went away mid-clip
+                    decoder.stdout.close()
+                    if decoder.poll() is None:
+                        decoder.kill()
+                    decoder.wait()
+
+                if written == 0:
+                    logging.error(f"Could not decode {input_file}, leaving it out")
+                    continue
+
+                # Pad short clips with silence, a chunk at a time
+                while written < clip_bytes:
+                    silence = min(budget.chunk_bytes(), clip_bytes - written)
+                    encoder.stdin.write(b'\0' * silence)
+                    written += silence
+                clips_written += 1
+                logging.info(f'Added {input_file} to the mashup')
+    except BrokenPipeError:
+        encoder.wait()
+        raise RuntimeError(f"ffmpeg stopped encoding {output_file} early (exit code {encoder.returncode})")
+    finally:
+        try:
+            encoder.stdin.close()
+        except BrokenPipeError:
+            # Nothing more can reach an encoder that already exited
+            pass
+        encoder.wait()
+
+    if encoder.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not encode {output_file} (exit code {encoder.returncode})")
+    if clips_written == 0:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        raise ValueError("None of the clips could be decoded, no mashup was written.")
+    logging.info(f'Mashup saved as {output_file}')
+
+
+def fits_single_pass(budget, number_of_inputs):
+    # The one-shot ffmpeg graph keeps every input open at once
+    return FFMPEG_FOOTPRINT + number_of_inputs * FFMPEG_INPUT_FOOTPRINT <= budget.headroom()
+
+
+def render_within_budget(video_files, audio_folder, output_file, duration, render_backend, budget,
+                         output_format=DEFAULT_OUTPUT_FORMAT, bitrate=None):
+    if render_backend == 'ffmpeg' and fits_single_pass(budget, len(video_files)):
+        with budget.reserve(FFMPEG_FOOTPRINT + len(video_files) * FFMPEG_INPUT_FOOTPRINT):
+            create_mashup_ffmpeg(video_files, output_file, duration, output_format=output_format, bitrate=bitrate)
+        return
+
+    if render_backend == 'ffmpeg':
+        logging.warning(f"{len(video_files)} inputs do not fit the memory budget in one ffmpeg pass, streaming instead")
+    audio_files = extract_all_audio(video_files, audio_folder, budget, duration)
+    if not audio_files:
+        raise ValueError("No audio could be extracted from the downloaded videos.")
+    create_mashup_streaming(audio_files, output_file, duration, budget, output_format, bitrate)
+
+
+def create_zip_file(file_path):
+    # The mashup is already compressed audio (or FLAC), so store it. The archive stays on
+    # disk; the caller streams it into the email and removes it afterwards.
+    fd, zip_path = tempfile.mkstemp(suffix='.zip')
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as zip_file:
+            zip_file.write(file_path, os.path.basename(file_path))
+    except Exception:
+        os.remove(zip_path)
+        raise
+    logging.info(f"Zip file created for {file_path}, size: {os.path.getsize(zip_path)} bytes")
+    return zip_path
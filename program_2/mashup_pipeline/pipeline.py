@@ -0,0 +1,65 @@
+import os
+import shutil
+import logging
+import tempfile
+
+from .config import PipelineConfig
+from .download import download_all_videos
+from .registry import get_backend
+from .render import render
+
+
+class NoLinksFound(Exception):
+    pass
+
+
+def search_links(singer_name, number_of_videos, config):
+    search = get_backend('search', config.search_backend)
+    query = config.search_query.format(singer_name=singer_name)
+    return search(query, number_of_videos, config.extra_links)
+
+
+def download_videos(links, video_folder, number_of_videos, config):
+    return download_all_videos(links, video_folder, number_of_videos, config.max_video_duration,
+                               config.min_video_duration, config.download_workers())
+
+
+def run_pipeline(singer_name, number_of_videos, duration, output_file, config=None, links=None):
+    # search -> download -> render, in a private working folder that is removed afterwards
+    config = (config or PipelineConfig.from_env()).validate()
+
+    if links is None:
+        links = search_links(singer_name, number_of_videos, config)
+    if not links:
+        raise NoLinksFound("No links found for the query.")
+
+    # Each run gets its own folders so concurrent jobs don't clear each other's files
+    job_folder = tempfile.mkdtemp(prefix="mashup_", dir=config.work_dir)
+    try:
+        video_files = download_videos(links, os.path.join(job_folder, "videos"), number_of_videos, config)
+        if not video_files:
+            raise ValueError("No videos were downloaded.")
+
+        render(video_files, os.path.join(job_folder, "audios"), output_file, duration, config)
+        logging.info(f"Pipeline finished: {output_file}")
+        return output_file
+    finally:
+        shutil.rmtree(job_folder, ignore_errors=True)
+
+
+def run_pipeline_into(result_folder, output_filename, singer_name, number_of_videos, duration, config=None):
+    # Each run gets its own folder under result_folder so cached results don't overwrite each
+    # other; the folder is removed again if the run fails
+    os.makedirs(result_folder, exist_ok=True)
+    output_folder = tempfile.mkdtemp(dir=result_folder)
+    try:
+        return run_pipeline(singer_name, number_of_videos, duration,
+                            os.path.join(output_folder, output_filename), config)
+    except Exception:
+        shutil.rmtree(output_folder, ignore_errors=True)
+        raise
+
+
+def remove_result(output_file):
+    # Counterpart of run_pipeline_into, e.g. for evicting a cached result
+    shutil.rmtree(os.path.dirname(output_file), ignore_errors=True)
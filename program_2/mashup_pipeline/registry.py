@@ -0,0 +1,27 @@
+# Named implementations for the swappable pipeline stages.
+#   search -> func(query, max_results, extra_links) returning a list of video URLs
+#   render -> func(video_files, audio_folder, output_file, duration, config) writing the mashup
+# New backends register themselves with @register('render', 'name') and become
+# selectable from every entry point through PipelineConfig.
+
+STAGES = ('search', 'render')
+
+_backends = {stage: {} for stage in STAGES}
+
+
+def register(stage, name):
+    def decorator(func):
+        _backends[stage][name] = func
+        return func
+    return decorator
+
+
+def get_backend(stage, name):
+    try:
+        return _backends[stage][name]
+    except KeyError:
+        raise ValueError(f"Unknown {stage} backend '{name}', choose one of: {', '.join(available_backends(stage))}")
+
+
+def available_backends(stage):
+    return tuple(_backends[stage])
@@ -0,0 +1,59 @@
+import os
+import logging
+
+from .convert import convert_all_videos_to_audio
+from .ffmpeg_render import create_mashup_ffmpeg
+from .formats import OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT, encoder_args
+from .memory import render_within_budget
+from .registry import register, get_backend
+
+
+def create_mashup(audio_files, output_file, duration, output_format=DEFAULT_OUTPUT_FORMAT, bitrate=None):
+    # Imported here so the ffmpeg and streaming paths don't need pydub
+    from pydub import AudioSegment
+
+    mashup = AudioSegment.silent(duration=0)
+    logging.info(f"Creating mashup from {len(audio_files)} files with duration {duration} seconds.")
+
+    for audio_path in audio_files:
+        audio = AudioSegment.from_file(audio_path)
+
+        if len(audio) > duration * 1000:  # Convert seconds to milliseconds
+            audio = audio[:duration * 1000]
+        else:
+            audio += AudioSegment.silent(duration=(duration * 1000) - len(audio))
+
+        mashup += audio
+        logging.info(f'Added {os.path.basename(audio_path)} to the mashup')
+
+    output_dir = os.path.dirname(output_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    mashup.export(output_file, format=OUTPUT_FORMATS[output_format]['muxer'],
+                  parameters=encoder_args(output_format, bitrate))
+    logging.info(f'Mashup saved as {output_file}')
+
+
+# MoviePy extracts each clip to WAV, pydub trims/pads and exports
+@register('render', 'pydub')
+def render_pydub(video_files, audio_folder, output_file, duration, config):
+    audio_files = convert_all_videos_to_audio(video_files, audio_folder)
+    if not audio_files:
+        raise ValueError("None of the downloaded videos could be converted to audio.")
+    create_mashup(audio_files, output_file, duration, config.output_format, config.bitrate)
+
+
+# One ffmpeg invocation trims, pads, joins and encodes straight from the downloads
+@register('render', 'ffmpeg')
+def render_ffmpeg(video_files, audio_folder, output_file, duration, config):
+    create_mashup_ffmpeg(video_files, output_file, duration,
+                         output_format=config.output_format, bitrate=config.bitrate)
+
+
+def render(video_files, audio_folder, output_file, duration, config):
+    if config.memory_budget is not None:
+        # Stream-copy extraction and chunked decode into one encoder
+        render_within_budget(video_files, audio_folder, output_file, duration, config.render_backend,
+                             config.memory_budget, config.output_format, config.bitrate)
+    else:
+        get_backend('render', config.render_backend)(video_files, audio_folder, output_file, duration, config)
@@ -0,0 +1,70 @@
+import os
+import random
+import logging
+
+from .registry import register
+
+user_agents = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/59.0.3071.115 Safari/537.3',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/60.0.3112.90 Safari/537.3',
+]
+
+# The YouTube Data API returns at most 50 results per page
+YOUTUBE_API_MAX_RESULTS = 50
+
+
+def get_random_user_agent():
+    return random.choice(user_agents)
+
+
+# Search through yt-dlp, no API key needed
+@register('search', 'ytdlp')
+def search_youtube_music_links(query, max_results, extra_links=10):
+    # Each backend imports its own client, so neither is needed unless that backend is used
+    import yt_dlp
+
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'force_generic_extractor': True,
+    }
+
+    total_results = max_results + extra_links  # Fetch more links than needed
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        search_url = f"ytsearch{total_results}:{query}"
+        result = ydl.extract_info(search_url, download=False)
+
+    links = []
+    for entry in result['entries']:
+        try:
+            link = f"https://www.youtube.com/watch?v={entry['id']}"
+            links.append(link)
+        except yt_dlp.utils.DownloadError as e:
+            logging.error(f"Skipping {entry['title']}: {e}")
+
+    return links
+
+
+# Search through the YouTube Data API (YOUTUBE_API_KEY), used where yt-dlp search gets blocked
+@register('search', 'youtube_api')
+def search_youtube_api_links(query, max_results, extra_links=10):
+    import requests
+
+    total_results = min(YOUTUBE_API_MAX_RESULTS, max_results + extra_links)
+    logging.info(f"Searching YouTube Music links for query: {query} with max results: {total_results}")
+    api_key = os.getenv('YOUTUBE_API_KEY')
+    search_url = "https://www.googleapis.com/youtube/v3/search"
+    params = {'part': 'snippet', 'type': 'video', 'q': query, 'maxResults': total_results, 'key': api_key}
+
+    try:
+        response = requests.get(search_url, params=params, headers={'User-Agent': get_random_user_agent()})
+        response.raise_for_status()
+        logging.info("Successfully retrieved YouTube links.")
+        items = response.json().get('items', [])
+        links = [f"https://www.youtube.com/watch?v={item['id']['videoId']}" for item in items]
+        logging.debug(f"Found links: {links}")
+        return links
+    except requests.RequestException as e:
+        logging.error(f"Error searching YouTube Music links: {e}")
+        return []
@@ -0,0 +1,7 @@
+# Run with: python -m pytest program_2/tests
+# The tests import mashup_pipeline the same way the apps in program_2 do.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
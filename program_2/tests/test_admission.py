@@ -0,0 +1,84 @@
+import time
+import threading
+
+import pytest
+
+from mashup_pipeline.admission import CostBudget, CostReservation, JobCoalescer, RateLimiter, ServerBusy
+
+
+def test_identical_jobs_run_once_and_pay_once():
+    budget = CostBudget(max_cost=100)
+    coalescer = JobCoalescer()
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def render():
+        calls.append(1)
+        started.set()
+        release.wait(timeout=5)
+        return 'mashup.mp3'
+
+    def request():
+        reservation = CostReservation(budget, 60)
+        try:
+            with coalescer.run('job', render, admit=reservation.admit) as result:
+                results.append(result)
+        finally:
+            reservation.release()
+
+    leader = threading.Thread(target=request)
+    leader.start()
+    started.wait(timeout=5)
+    # A second 60-cost job would not fit next to the first, but attaching is free
+    followers = [threading.Thread(target=request) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(timeout=5)
+
+    assert len(calls) == 1
+    assert results == ['mashup.mp3'] * 4
+    assert budget.inflight == 0
+
+
+def test_leader_is_charged_even_when_the_hint_said_cached():
+    budget = CostBudget(max_cost=100)
+    coalescer = JobCoalescer(ttl=-1)
+    with coalescer.run('job', lambda: 'old.mp3'):
+        pass
+    # The cached entry has expired by the time the job runs, so it must pay
+    busy = CostReservation(budget, 80)
+    busy.admit(leader=True)
+
+    reservation = CostReservation(budget, 60)
+    with pytest.raises(ServerBusy):
+        with coalescer.run('job', lambda: 'new.mp3', admit=reservation.admit):
+            pass
+    assert budget.inflight == 80
+    assert coalescer.lookup('job') is None
+
+
+def test_results_in_use_are_not_evicted():
+    evicted = []
+    coalescer = JobCoalescer(ttl=-1, on_evict=evicted.append)
+
+    with coalescer.run('job', lambda: 'mashup.mp3') as result:
+        # Another request triggers eviction while the first one is still zipping
+        coalescer.lookup('other')
+        assert evicted == []
+        assert result == 'mashup.mp3'
+
+    coalescer.lookup('other')
+    assert evicted == ['mashup.mp3']
+
+
+def test_rate_limiter_forgets_idle_clients():
+    limiter = RateLimiter(limit=1, window=0.1)
+    for n in range(100):
+        assert limiter.allow(f'10.0.0.{n}')
+    assert not limiter.allow('10.0.0.1')
+
+    time.sleep(0.2)
+    assert limiter.allow('10.0.0.1')
+    assert list(limiter.requests) == ['10.0.0.1']
@@ -0,0 +1,33 @@
+import io
+import os
+import email
+import zipfile
+
+import pytest
+
+from mashup_pipeline.delivery import write_email_message, BASE64_LINE_BYTES
+from mashup_pipeline.memory import create_zip_file
+
+
+def test_streamed_message_carries_the_whole_zip(tmp_path):
+    mashup = tmp_path / 'mashup.mp3'
+    # Not a multiple of the streaming block size, so the last block is partial
+    mashup.write_bytes(bytes(range(256)) * (BASE64_LINE_BYTES * 40 + 3))
+    zip_path = create_zip_file(str(mashup))
+    try:
+        message = io.BytesIO()
+        write_email_message(message.write, 'me@example.com', 'you@example.com', zip_path, 'mashup.zip')
+        with open(zip_path, 'rb') as f:
+            expected = f.read()
+    finally:
+        os.remove(zip_path)
+
+    raw = message.getvalue()
+    assert raw.endswith(b'\r\n')
+    assert all(len(line) <= 78 for line in raw.split(b'\r\n'))
+
+    parsed = email.message_from_bytes(raw)
+    attachment = [part for part in parsed.walk() if part.get_filename() == 'mashup.zip'][0]
+    assert attachment.get_payload(decode=True) == expected
+    with zipfile.ZipFile(io.BytesIO(expected)) as archive:
+        assert archive.read('mashup.mp3') == mashup.read_bytes()
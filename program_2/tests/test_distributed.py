@@ -0,0 +1,218 @@
+# Coordinator/worker mode end to end: several local worker processes share one
+# SQLite queue and artifact store. The download/convert/mix/deliver stages are
+# replaced with small file stubs so no network, ffmpeg or SMTP is needed.
+
+import os
+import time
+import sqlite3
+import multiprocessing
+
+import pytest
+
+from mashup_pipeline import PipelineConfig, distributed
+from mashup_pipeline.admission import ServerBusy, job_key
+from mashup_pipeline.distributed import ArtifactStore, SQLiteQueue, attach_to_job, run_worker, submit_job
+
+FAILING_URL = 'https://example.com/broken'
+
+
+def fake_download(url, index, download_path, max_duration=600, min_duration=60):
+    if url == FAILING_URL:
+        return None
+    os.makedirs(download_path, exist_ok=True)
+    path = os.path.join(download_path, f'video_{index}.mp4')
+    with open(path, 'w') as f:
+        f.write(url)
+    return path
+
+
+def fake_convert(video_files, audio_folder):
+    os.makedirs(audio_folder, exist_ok=True)
+    path = os.path.join(audio_folder, 'song_1.wav')
+    with open(video_files[0]) as source, open(path, 'w') as f:
+        f.write(f"audio:{source.read()}")
+    return [path]
+
+
+def fake_create_mashup(audio_files, output_file, duration, output_format='mp3', bitrate=None):
+    with open(output_file, 'w') as f:
+        for audio_file in audio_files:
+            with open(audio_file) as clip:
+                f.write(clip.read() + '\n')
+
+
+def fake_deliver(email, file_path, zip_name, memory_budget=None):
+    # Each worker is its own process, so deliveries are recorded in a file
+    with open(file_path) as mashup, open(os.environ['MASHUP_TEST_OUTBOX'], 'a') as f:
+        f.write(f"{email}|{mashup.read().strip().replace(chr(10), ',')}\n")
+    return True
+
+
+@pytest.fixture
+def stubbed_stages(monkeypatch, tmp_path):
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip("worker processes inherit the stubs through fork")
+    monkeypatch.delenv('MASHUP_MEMORY_BUDGET_MB', raising=False)
+    monkeypatch.setenv('MASHUP_TEST_OUTBOX', str(tmp_path / 'outbox.txt'))
+    monkeypatch.setattr(distributed, 'download_single_video', fake_download)
+    monkeypatch.setattr(distributed, 'convert_all_videos_to_audio', fake_convert)
+    monkeypatch.setattr(distributed, 'create_mashup', fake_create_mashup)
+    monkeypatch.setattr(distributed, 'deliver_mashup', fake_deliver)
+    return tmp_path
+
+
+def run_workers(queue_url, store_root, processes):
+    context = multiprocessing.get_context('fork')
+    workers = [
+        context.Process(target=run_worker, args=(queue_url, store_root),
+                        kwargs={'stop_when_idle': True, 'worker_id': f'test-{n}'})
+        for n in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+
+
+def test_workers_finish_every_job_once(stubbed_stages):
+    queue_url = f"sqlite:///{stubbed_stages / 'queue.db'}"
+    store_root = str(stubbed_stages / 'artifacts')
+    queue = SQLiteQueue(str(stubbed_stages / 'queue.db'))
+    config = PipelineConfig()
+
+    jobs = {}
+    for singer in ('a', 'b', 'c'):
+        links = [f'https://example.com/{singer}/{n}' for n in range(1, 5)]
+        # One broken link per job; the spare link takes its place
+        links.insert(1, FAILING_URL)
+        jobs[singer] = submit_job(queue, links, singer, 3, 5, f'{singer}@example.com', config)
+
+    run_workers(queue_url, store_root, processes=4)
+
+    for job_id in jobs.values():
+        assert queue.job(job_id)['status'] == 'done'
+
+    deliveries = {}
+    with open(stubbed_stages / 'outbox.txt') as f:
+        for line in f:
+            email, clips = line.strip().split('|')
+            assert email not in deliveries, f"{email} was sent twice"
+            deliveries[email] = clips.split(',')
+
+    assert sorted(deliveries) == sorted(f'{singer}@example.com' for singer in jobs)
+    for singer in jobs:
+        good_clips = [f'audio:https://example.com/{singer}/{n}' for n in range(1, 5)]
+        clips = deliveries[f'{singer}@example.com']
+        # Three working clips, kept in search order
+        assert len(clips) == 3
+        assert clips == sorted(clips, key=good_clips.index)
+
+
+def test_artifact_sweep_removes_only_expired_artifacts(tmp_path):
+    store = ArtifactStore(str(tmp_path / 'artifacts'))
+    source = tmp_path / 'clip.wav'
+    source.write_text('old')
+    old_key = store.put(str(source))
+    source.write_text('new')
+    new_key = store.put(str(source))
+
+    an_hour_ago = time.time() - 3600
+    os.utime(store.path(old_key), (an_hour_ago, an_hour_ago))
+
+    assert store.sweep(max_age=600) == 1
+    assert not os.path.exists(store.path(old_key))
+    assert os.path.exists(store.path(new_key))
+
+
+def test_reusing_an_artifact_keeps_it_alive(tmp_path):
+    store = ArtifactStore(str(tmp_path / 'artifacts'))
+    source = tmp_path / 'clip.wav'
+    source.write_text('shared')
+    key = store.put(str(source))
+
+    an_hour_ago = time.time() - 3600
+    os.utime(store.path(key), (an_hour_ago, an_hour_ago))
+    # A second job puts the same content
+    store.put(str(source))
+
+    assert store.sweep(max_age=600) == 0
+    assert os.path.exists(store.path(key))
+
+
+def test_heartbeat_keeps_a_long_task_leased(tmp_path):
+    queue = SQLiteQueue(str(tmp_path / 'queue.db'), lease_seconds=0.3)
+    queue.put('mix', 'job', {})
+    task = queue.get('slow-worker')
+
+    with distributed.heartbeat(queue, task['id'], 'slow-worker'):
+        # Several lease lengths pass while the handler is still running
+        time.sleep(1)
+        assert queue.get('other-worker') is None
+
+    time.sleep(0.5)
+    assert queue.get('other-worker')['id'] == task['id']
+
+
+def test_a_mashup_is_delivered_once(stubbed_stages):
+    queue = SQLiteQueue(str(stubbed_stages / 'queue.db'))
+    store = ArtifactStore(str(stubbed_stages / 'artifacts'))
+    job_id = submit_job(queue, [], 'a', 1, 5, 'a@example.com', PipelineConfig())
+    mashup = stubbed_stages / 'a_mashup.mp3'
+    mashup.write_text('mashup')
+    artifact = store.put(str(mashup))
+
+    # Two mix attempts each queued a deliver task
+    for delivery_id in ('first', 'second'):
+        payload = {'artifact': artifact, 'filename': 'a_mashup.mp3', 'delivery_id': delivery_id}
+        work_dir = stubbed_stages / delivery_id
+        work_dir.mkdir()
+        distributed.handle_deliver(queue, store, queue.job(job_id), payload, str(work_dir))
+
+    with open(stubbed_stages / 'outbox.txt') as f:
+        assert f.read().splitlines() == ['a@example.com|mashup']
+
+
+def test_worker_outlives_a_queue_outage(tmp_path, monkeypatch):
+    monkeypatch.setattr(distributed, 'POLL_SECONDS', 0.01)
+    calls = []
+    real_get = SQLiteQueue.get
+
+    def flaky_get(self, worker_id):
+        calls.append(worker_id)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        return real_get(self, worker_id)
+
+    monkeypatch.setattr(SQLiteQueue, 'get', flaky_get)
+    run_worker(f"sqlite:///{tmp_path / 'queue.db'}", str(tmp_path / 'artifacts'), stop_when_idle=True)
+    assert len(calls) == 2
+
+
+def test_queued_duplicates_share_one_job_within_the_cost_budget(stubbed_stages):
+    queue_url = f"sqlite:///{stubbed_stages / 'queue.db'}"
+    queue = SQLiteQueue(str(stubbed_stages / 'queue.db'))
+    config = PipelineConfig()
+    links = [f'https://example.com/a/{n}' for n in range(1, 4)]
+
+    def key_for(singer):
+        return job_key(singer, 3, 5, 'pydub', 'mp3', None)
+
+    key = key_for('a')
+
+    # 3 clips x 5 seconds = 15, so only one such job fits a budget of 20
+    job_id = submit_job(queue, links, 'a', 3, 5, 'first@example.com', config, key=key, max_cost=20)
+    assert attach_to_job(queue, key, 'second@example.com') == job_id
+    # Same singer spelt differently, and the search already ran: still the same job
+    assert submit_job(queue, links, 'A ', 3, 5, 'third@example.com', config, key=key_for('A '), max_cost=20) == job_id
+    with pytest.raises(ServerBusy):
+        submit_job(queue, links, 'b', 3, 5, 'other@example.com', config, key=key_for('b'), max_cost=20)
+
+    run_workers(queue_url, str(stubbed_stages / 'artifacts'), processes=2)
+
+    with open(stubbed_stages / 'outbox.txt') as f:
+        emails = [line.split('|')[0] for line in f]
+    assert sorted(emails) == ['first@example.com', 'second@example.com', 'third@example.com']
+    # The finished job no longer holds its key or its share of the budget
+    assert attach_to_job(queue, key, 'late@example.com') is None
+    submit_job(queue, links, 'b', 3, 5, 'other@example.com', config, key=key_for('b'), max_cost=20)
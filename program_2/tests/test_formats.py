@@ -0,0 +1,38 @@
+import pytest
+
+from mashup_pipeline.formats import encoder_args, filename_for_format, validate_output
+
+
+@pytest.mark.parametrize('bitrate, quality', [(None, '2'), ('64k', '9'), ('128k', '5'), ('192k', '2'), ('320k', '0')])
+def test_mp3_vbr_stays_vbr_with_a_bitrate(bitrate, quality):
+    args = encoder_args('mp3-vbr', bitrate)
+    assert '-b:a' not in args
+    assert args[args.index('-q:a') + 1] == quality
+
+
+def test_constant_bitrate_formats_use_the_bitrate():
+    assert encoder_args('mp3', '128k')[:4] == ['-c:a', 'libmp3lame', '-b:a', '128k']
+    assert '-b:a' not in encoder_args('flac', '128k')
+
+
+def test_flac_is_16_bit():
+    args = encoder_args('flac')
+    assert args[args.index('-sample_fmt') + 1] == 's16'
+
+
+@pytest.mark.parametrize('bitrate', ['999k', '32k', '128K', '128'])
+def test_bitrates_the_encoders_reject_are_refused_up_front(bitrate):
+    with pytest.raises(ValueError):
+        validate_output('opus', bitrate)
+
+
+@pytest.mark.parametrize('filename, output_format, expected', [
+    ('final_mashup.mp3', 'opus', 'final_mashup.opus'),
+    ('final_mashup.mp3', 'mp3-vbr', 'final_mashup.mp3'),
+    # Written as MP4, so a raw-AAC name would be wrong
+    ('final_mashup.aac', 'aac', 'final_mashup.m4a'),
+    ('final_mashup', 'mp3', 'final_mashup.mp3'),
+    ('final.mashup.flac', 'flac', 'final.mashup.flac'),
+])
+def test_filename_matches_the_format(filename, output_format, expected):
+    assert filename_for_format(filename, output_format) == expected
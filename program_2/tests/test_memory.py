@@ -0,0 +1,102 @@
+# Memory-bounded mode on a 50-clip job. Needs the ffmpeg binary; skipped without it.
+
+import shutil
+import threading
+import subprocess
+
+import pytest
+
+from mashup_pipeline.ffmpeg_render import build_ffmpeg_mashup_command
+from mashup_pipeline.memory import (MemoryBudget, BYTES_PER_SECOND, tree_rss, create_mashup_streaming,
+                                    render_within_budget)
+
+pytestmark = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="ffmpeg is not installed")
+
+NUMBER_OF_CLIPS = 50
+CLIP_SECONDS = 2
+# Room for this process and its ffmpeg children on top of what the process already uses.
+# The streaming path peaks around 37 MB above that, one ffmpeg pass over all 50 clips around 67 MB.
+BUDGET_HEADROOM = 48 * 1024 * 1024
+
+
+@pytest.fixture(scope='module')
+def clips(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('clips')
+    paths = []
+    for index in range(1, NUMBER_OF_CLIPS + 1):
+        # Every fifth clip is shorter than the mashup duration and has to be padded
+        seconds = 1 if index % 5 == 0 else 3
+        path = str(folder / f'clip_{index}.wav')
+        subprocess.run(['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-f', 'lavfi',
+                        '-i', f'sine=frequency={200 + index * 10}:duration={seconds}', '-ac', '2', path],
+                       check=True)
+        paths.append(path)
+    return paths
+
+
+class RSSSampler:
+    # Peak RSS of this process plus all of its children
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = tree_rss()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, tree_rss())
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def decoded_bytes(path):
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', path,
+               '-f', 's16le', '-ac', '2', '-ar', '44100', '-']
+    return len(subprocess.run(command, capture_output=True, check=True).stdout)
+
+
+def test_50_clip_job_stays_under_the_budget(clips, tmp_path):
+    budget = MemoryBudget(tree_rss() + BUDGET_HEADROOM)
+    output = str(tmp_path / 'mashup.flac')
+
+    with RSSSampler() as sampler:
+        render_within_budget(clips, str(tmp_path / 'audios'), output, CLIP_SECONDS, 'pydub', budget, 'flac')
+
+    assert sampler.peak <= budget.limit
+    # Every clip trimmed or padded to exactly CLIP_SECONDS
+    assert decoded_bytes(output) == NUMBER_OF_CLIPS * CLIP_SECONDS * BYTES_PER_SECOND
+
+
+def test_unbounded_single_pass_goes_over_the_same_budget(clips, tmp_path):
+    # Keeps the check above honest: decoding all 50 clips at once in one ffmpeg must register as too much
+    budget = MemoryBudget(tree_rss() + BUDGET_HEADROOM)
+    command = build_ffmpeg_mashup_command(clips, str(tmp_path / 'mashup.flac'), CLIP_SECONDS, 'flac')
+
+    with RSSSampler() as sampler:
+        subprocess.run(command, capture_output=True, check=True)
+
+    assert sampler.peak > budget.limit
+
+
+def test_encoder_failure_raises_runtime_error(clips, tmp_path):
+    budget = MemoryBudget(tree_rss() + BUDGET_HEADROOM)
+    with pytest.raises(RuntimeError):
+        # An invalid bitrate makes the encoder exit before reading its input
+        create_mashup_streaming(clips, str(tmp_path / 'mashup.mp3'), CLIP_SECONDS, budget, 'mp3', 'garbage')
+
+
+def test_no_decodable_clips_is_an_error(tmp_path):
+    budget = MemoryBudget(tree_rss() + BUDGET_HEADROOM)
+    broken = tmp_path / 'broken.wav'
+    broken.write_text('not audio')
+    output = tmp_path / 'mashup.mp3'
+
+    with pytest.raises(ValueError):
+        create_mashup_streaming([str(broken)], str(output), CLIP_SECONDS, budget)
+    assert not output.exists()
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from mashup_pipeline import PipelineConfig, NoLinksFound, pipeline
+
+
+@pytest.fixture
+def config(tmp_path):
+    return PipelineConfig(work_dir=str(tmp_path / 'work'))
+
+
+def test_failed_run_leaves_no_output_folder(monkeypatch, tmp_path, config):
+    os.makedirs(config.work_dir)
+    monkeypatch.setattr(pipeline, 'search_links', lambda *args: ['https://example.com/1'])
+    monkeypatch.setattr(pipeline, 'download_videos', lambda *args: ['video_1.mp4'])
+
+    def failing_render(*args):
+        raise RuntimeError("encoder crashed")
+    monkeypatch.setattr(pipeline, 'render', failing_render)
+
+    results = tmp_path / 'results'
+    with pytest.raises(RuntimeError):
+        pipeline.run_pipeline_into(str(results), 'mashup.mp3', 'singer', 10, 5, config)
+    assert os.listdir(results) == []
+    assert os.listdir(config.work_dir) == []
+
+
+def test_no_links_is_its_own_error(monkeypatch, tmp_path, config):
+    monkeypatch.setattr(pipeline, 'search_links', lambda *args: [])
+    with pytest.raises(NoLinksFound):
+        pipeline.run_pipeline_into(str(tmp_path / 'results'), 'mashup.mp3', 'singer', 10, 5, config)
+
+
+def test_lookup_errors_inside_the_pipeline_are_not_no_links(monkeypatch, tmp_path, config):
+    def broken_search(*args):
+        return {}['videoId']
+    monkeypatch.setattr(pipeline, 'search_links', broken_search)
+    with pytest.raises(KeyError) as error:
+        pipeline.run_pipeline_into(str(tmp_path / 'results'), 'mashup.mp3', 'singer', 10, 5, config)
+    assert not isinstance(error.value, NoLinksFound)
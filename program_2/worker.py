@@ -0,0 +1,48 @@
+# Run mashup workers that pull download/convert/mix/deliver tasks from the shared queue.
+# Start as many as you like, on this machine or on others that can reach the queue and store:
+#
+# python worker.py --queue sqlite:///mashup_queue.db --store ./artifacts --processes 4
+# python worker.py --queue redis://queue-host:6379/0 --store /mnt/shared/artifacts
+#
+# Defaults come from MASHUP_QUEUE_URL and MASHUP_STORE_PATH, the same variables the web app reads.
+
+import os
+import argparse
+import logging
+import multiprocessing
+
+from dotenv import load_dotenv
+
+from mashup_pipeline.distributed import run_worker
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mashup worker")
+    parser.add_argument('--queue', default=os.getenv('MASHUP_QUEUE_URL'),
+                        help="sqlite:///path/to/queue.db or redis://host:port/db")
+    parser.add_argument('--store', default=os.getenv('MASHUP_STORE_PATH', 'artifacts'),
+                        help="Shared artifact directory")
+    parser.add_argument('--processes', type=int, default=1, help="Worker processes to start on this node")
+    parser.add_argument('--exit-when-idle', action='store_true', help="Stop once the queue is empty")
+    args = parser.parse_args()
+
+    if not args.queue:
+        parser.error("--queue or MASHUP_QUEUE_URL is required")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s')
+
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(args.queue, args.store),
+                                kwargs={'stop_when_idle': args.exit_when_idle}, name=f"worker-{n}")
+        for n in range(1, args.processes + 1)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()